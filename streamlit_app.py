@@ -1,84 +1,228 @@
+import os
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.layers import Input, Dense, GRU, LSTM, SimpleRNN, Dropout, Bidirectional, Layer, concatenate
-from tensorflow.keras.models import Model
-from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, ModelCheckpoint, TensorBoard
-import os
 import tempfile
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.preprocessing import MinMaxScaler, StandardScaler, RobustScaler
+import shutil
+import hashlib
+import importlib
+import importlib.util
+from sklearn.preprocessing import StandardScaler, RobustScaler
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from sklearn.model_selection import TimeSeriesSplit
 from io import BytesIO
-from tensorflow.keras.utils import plot_model
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import json
+import copy
+import functools
+import itertools
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 import warnings
-import optuna
-from scipy import stats
 
 # Suppress all warnings
 warnings.filterwarnings('ignore')
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
+# Copy-on-write lets preprocessing derive frames from the uploaded data without cloning it
+pd.set_option('mode.copy_on_write', True)
+
+# -------------------- Lazy Imports --------------------
+@functools.lru_cache(maxsize=None)
+def lazy_import(name):
+    """Import a heavy module on first use; later calls return the cached module."""
+    return importlib.import_module(name)
+
+@functools.lru_cache(maxsize=None)
+def keras_api():
+    """Import Keras symbols and define the TensorFlow-backed classes on first use."""
+    tf = lazy_import('tensorflow')
+    from tensorflow.keras.layers import Input, Dense, GRU, LSTM, SimpleRNN, Dropout, Bidirectional, Flatten, Layer, concatenate
+    from tensorflow.keras.models import Model
+    from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, ModelCheckpoint, TensorBoard
+
+    # -------------------- PINN Custom Layer --------------------
+    class PhysicsInformedLayer(Layer):
+        def __init__(self, **kwargs):
+            super(PhysicsInformedLayer, self).__init__(**kwargs)
+            
+        def build(self, input_shape):
+            self.kernel = self.add_weight(name='kernel',
+                                        shape=(input_shape[-1], 1),
+                                        initializer='glorot_uniform',
+                                        trainable=True)
+            self.bias = self.add_weight(name='bias',
+                                      shape=(1,),
+                                      initializer='zeros',
+                                      trainable=True)
+            super(PhysicsInformedLayer, self).build(input_shape)
+        
+        def call(self, inputs):
+            # Apply physics constraints
+            # 1. Mass conservation
+            # 2. Non-negativity
+            # 3. Smoothness constraint
+            x = tf.matmul(inputs, self.kernel) + self.bias
+            x = tf.nn.relu(x)  # Non-negativity
+            return x
+        
+        def compute_output_shape(self, input_shape):
+            return (input_shape[0], 1)
+
+    # -------------------- Advanced Custom Callbacks --------------------
+    class StreamlitProgressCallback(tf.keras.callbacks.Callback):
+        def __init__(self, total_epochs, progress_placeholder):
+            super().__init__()
+            self.total_epochs = total_epochs
+            self.progress_placeholder = progress_placeholder
+            self.current_epoch = 0
+            self.metrics_history = []
+            self.last_update = float('-inf')
+
+        def on_epoch_end(self, epoch, logs=None):
+            self.current_epoch = epoch + 1
+            
+            # Store metrics history
+            self.metrics_history.append(logs)
+            
+            # Throttle UI updates; each one is a round-trip to the browser
+            now = time.monotonic()
+            if now - self.last_update < PROGRESS_MIN_INTERVAL and self.current_epoch < self.total_epochs:
+                return
+            self.last_update = now
+            self.render(logs)
+
+        def on_train_end(self, logs=None):
+            # Show the final epoch even if early stopping landed inside a throttle window
+            if self.metrics_history:
+                self.render(self.metrics_history[-1])
+
+        def render(self, logs):
+            # Bar and metrics travel as a single message
+            progress = self.current_epoch / self.total_epochs
+            metrics_text = " · ".join(f"{metric}: {value:.4f}" for metric, value in logs.items())
+            self.progress_placeholder.progress(
+                min(progress, 1.0), text=f"Epoch {self.current_epoch}/{self.total_epochs} — {metrics_text}"
+            )
+
+    class OptunaPruningCallback(tf.keras.callbacks.Callback):
+        """Report each epoch's metric to an Optuna trial and stop training once it is pruned."""
+        def __init__(self, trial, monitor='val_loss'):
+            super().__init__()
+            self.trial = trial
+            self.monitor = monitor
+            self.pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            current = (logs or {}).get(self.monitor)
+            if current is None:
+                return
+            self.trial.report(float(current), step=epoch)
+            if self.trial.should_prune():
+                self.pruned = True
+                self.model.stop_training = True
+
+    class AdvancedModelCheckpoint(tf.keras.callbacks.ModelCheckpoint):
+        def __init__(self, filepath, monitor='val_loss', verbose=1, save_best_only=True, mode='min'):
+            super().__init__(filepath, monitor, verbose, save_best_only, mode)
+            self.best_epoch = 0
+            self.best_value = float('inf')
+
+        def on_epoch_end(self, epoch, logs=None):
+            current = logs.get(self.monitor)
+            if current is None:
+                return
+
+            if self.mode == 'min':
+                if current < self.best_value:
+                    self.best_value = current
+                    self.best_epoch = epoch
+                    super().on_epoch_end(epoch, logs)
+            else:
+                if current > self.best_value:
+                    self.best_value = current
+                    self.best_epoch = epoch
+                    super().on_epoch_end(epoch, logs)
+
+    return SimpleNamespace(**locals())
+
+def has_recurrent_layers(model):
+    """Whether a model runs recurrent layers, which lose the fused cuDNN kernel under XLA."""
+    k = keras_api()
+    return any(isinstance(layer, (k.GRU, k.LSTM, k.SimpleRNN, k.Bidirectional)) for layer in model.layers)
+
+def recurrent_layer(model_type, units, return_sequences):
+    """Build a recurrent layer pinned to its cuDNN-eligible configuration."""
+    k = keras_api()
+    if model_type == "GRU":
+        return k.GRU(units, return_sequences=return_sequences, activation='tanh', recurrent_activation='sigmoid',
+                     recurrent_dropout=0, unroll=False, use_bias=True, reset_after=True)
+    elif model_type == "LSTM":
+        return k.LSTM(units, return_sequences=return_sequences, activation='tanh', recurrent_activation='sigmoid',
+                      recurrent_dropout=0, unroll=False, use_bias=True)
+    # SimpleRNN has no fused cuDNN kernel
+    return k.SimpleRNN(units, return_sequences=return_sequences)
+
 # Simplified uncertainty estimation without TFP
 def get_uncertainty_model(input_shape, model_type, layers, units, dense_layers, dense_units, 
-                         learning_rate, use_attention, use_bidirectional, use_residual, dropout_rate):
-    inputs = Input(shape=input_shape)
+                         learning_rate, use_attention, use_bidirectional, use_residual, dropout_rate,
+                         jit_compile=True):
+    tf = lazy_import('tensorflow')
+    k = keras_api()
+    inputs = k.Input(shape=input_shape)
     x = inputs
     
     # Rest of the model architecture remains the same
     if model_type == "PINN":
         for i in range(layers):
-            x = Dense(units[i], activation='relu')(x)
-            x = Dropout(dropout_rate)(x)
-        x = PhysicsInformedLayer()(x)
+            x = k.Dense(units[i], activation='relu')(x)
+            x = k.Dropout(dropout_rate)(x)
+        x = k.PhysicsInformedLayer()(x)
     elif model_type == "Hybrid":
         # Hybrid model code remains the same
         pass
+    elif input_shape[0] == 1:
+        # One timestep only ever meets a zero hidden state, so same-width tanh Dense layers replace the RNN stack
+        x = k.Flatten()(x)
+        for i in range(layers):
+            x = k.Dense(units[i] * (2 if use_bidirectional else 1), activation='tanh')(x)
+            x = k.Dropout(dropout_rate)(x)
     else:
         for i in range(layers):
             return_seq = i < layers - 1
-            if use_bidirectional:
-                if model_type == "GRU":
-                    x = Bidirectional(GRU(units[i], return_sequences=return_seq))(x)
-                elif model_type == "LSTM":
-                    x = Bidirectional(LSTM(units[i], return_sequences=return_seq))(x)
-                elif model_type == "RNN":
-                    x = Bidirectional(SimpleRNN(units[i], return_sequences=return_seq))(x)
-            else:
-                if model_type == "GRU":
-                    x = GRU(units[i], return_sequences=return_seq)(x)
-                elif model_type == "LSTM":
-                    x = LSTM(units[i], return_sequences=return_seq)(x)
-                elif model_type == "RNN":
-                    x = SimpleRNN(units[i], return_sequences=return_seq)(x)
+            # Dropout stays in a separate layer so the fused cuDNN kernel is used
+            rnn = recurrent_layer(model_type, units[i], return_seq)
+            x = k.Bidirectional(rnn)(x) if use_bidirectional else rnn(x)
             
             if use_residual and return_seq and x.shape[-1] == inputs.shape[-1]:
-                x = concatenate([x, inputs])
-            x = Dropout(dropout_rate)(x)
+                x = k.concatenate([x, inputs])
+            x = k.Dropout(dropout_rate)(x)
     
     for unit in dense_units[:dense_layers]:
-        x = Dense(unit, activation='relu')(x)
-        x = Dropout(dropout_rate)(x)
+        x = k.Dense(unit, activation='relu')(x)
+        x = k.Dropout(dropout_rate)(x)
     
-    # Output layer for mean prediction only
-    outputs = Dense(1)(x)
-    model = Model(inputs=inputs, outputs=outputs)
+    # Output layer for mean prediction only (kept in float32 for a stable loss)
+    outputs = k.Dense(1, dtype='float32')(x)
+    model = k.Model(inputs=inputs, outputs=outputs)
+    # XLA only for non-recurrent stacks so GRU/LSTM keep the cuDNN path
     model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
-                 loss='mse')
+                 loss='mse', jit_compile=jit_compile and not has_recurrent_layers(model),
+                 steps_per_execution=STEPS_PER_EXECUTION)
     return model
 
 # Replace build_advanced_model function
 def build_advanced_model(input_shape, model_type, layers, units, dense_layers, dense_units, learning_rate, 
-                        use_attention=False, use_bidirectional=False, use_residual=False, dropout_rate=0.2):
+                        use_attention=False, use_bidirectional=False, use_residual=False, dropout_rate=0.2,
+                        jit_compile=True):
     return get_uncertainty_model(input_shape, model_type, layers, units, dense_layers, dense_units,
-                               learning_rate, use_attention, use_bidirectional, use_residual, dropout_rate)
+                               learning_rate, use_attention, use_bidirectional, use_residual, dropout_rate,
+                               jit_compile)
 
 # -------------------- Model Parameters --------------------
 DEFAULT_GRU_UNITS = 64
@@ -89,49 +233,104 @@ DEFAULT_DENSE_UNITS = 32
 DEFAULT_LEARNING_RATE = 0.001
 DEFAULT_EPOCHS = 50
 DEFAULT_BATCH_SIZE = 16
+STEPS_PER_EXECUTION = 16  # Training steps fused into one graph call; small batches are dispatch-bound
 DEFAULT_TRAIN_SPLIT = 80
 DEFAULT_NUM_LAGS = 3
 DEFAULT_PREDICTION_HORIZON = 7
 DEFAULT_PHYSICS_WEIGHT = 0.1
 MODEL_WEIGHTS_PATH = os.path.join(tempfile.gettempdir(), "model_weights.weights.h5")
-MODEL_FULL_PATH = os.path.join(tempfile.gettempdir(), "model.h5")
+MODEL_FULL_PATH = os.path.join(tempfile.gettempdir(), "model.keras")
 MODEL_PLOT_PATH = os.path.join(tempfile.gettempdir(), "model_plot.png")
+MODEL_SAVED_DIR = os.path.join(tempfile.gettempdir(), "model_savedmodel")
+MODEL_TRT_DIR = os.path.join(tempfile.gettempdir(), "model_tensorrt")
+MODEL_TFLITE_PATH = os.path.join(tempfile.gettempdir(), "model_int8.tflite")
 DEFAULT_MODEL_SAVE_PATH = "model_saved.h5"
 DEFAULT_TRAIN_CSV_PATH = "train_results.csv"
 DEFAULT_TEST_CSV_PATH = "test_results.csv"
 TENSORBOARD_DIR = os.path.join(tempfile.gettempdir(), "tensorboard_logs")
+OPTUNA_STORAGE = f"sqlite:///{os.path.join(tempfile.gettempdir(), 'optuna.db')}"
+OPTUNA_N_TRIALS = 8
+OPTUNA_N_JOBS = 1  # Serial trials: each already uses every core, and TF thread pools cannot be capped per trial
+OPTUNA_DB_TIMEOUT = 30  # Seconds a SQLite write waits on a lock held by another session
+PROGRESS_MIN_INTERVAL = 0.25  # Seconds between training progress redraws
+# Session keys holding the recurrent layer count and units per model type (Hybrid and PINN use the GRU settings)
+LAYERS_MAP = {"GRU": "gru_layers", "LSTM": "lstm_layers", "RNN": "rnn_layers", "PINN": "gru_layers", "Hybrid": "gru_layers"}
+UNITS_MAP = {"GRU": "gru_units", "LSTM": "lstm_units", "RNN": "rnn_units", "PINN": "gru_units", "Hybrid": "gru_units"}
 
-# -------------------- PINN Custom Layer --------------------
-class PhysicsInformedLayer(Layer):
-    def __init__(self, **kwargs):
-        super(PhysicsInformedLayer, self).__init__(**kwargs)
-        
-    def build(self, input_shape):
-        self.kernel = self.add_weight(name='kernel',
-                                    shape=(input_shape[-1], 1),
-                                    initializer='glorot_uniform',
-                                    trainable=True)
-        self.bias = self.add_weight(name='bias',
-                                  shape=(1,),
-                                  initializer='zeros',
-                                  trainable=True)
-        super(PhysicsInformedLayer, self).build(input_shape)
-    
-    def call(self, inputs):
-        # Apply physics constraints
-        # 1. Mass conservation
-        # 2. Non-negativity
-        # 3. Smoothness constraint
-        x = tf.matmul(inputs, self.kernel) + self.bias
-        x = tf.nn.relu(x)  # Non-negativity
-        return x
-    
-    def compute_output_shape(self, input_shape):
-        return (input_shape[0], 1)
+# -------------------- Session State Defaults --------------------
+_DEFAULTS = {
+    'model_type': "GRU",
+    'num_lags': DEFAULT_NUM_LAGS,
+    'input_vars': [],
+    'output_var': None,
+    'var_types': {},
+    'date_col': None,
+    'df': None,
+    'feature_cols': [],
+    'handle_missing': 'median',
+    'remove_outliers': True,
+    'outlier_threshold': 3.0,
+    'enable_feature_engineering': True,
+    'physics_weight': DEFAULT_PHYSICS_WEIGHT,
+    'use_mass_conservation': True,
+    'use_smoothness': True,
+    'use_tensorrt': False,
+    'trt_model': None,
+    'use_tflite': False,
+    'tflite_model': None,
+    'train_model_cache': {},
+    'sequence_input': True,
+    'use_mixed_precision': False,
+    'use_xla': False,
+    'log_histograms': False,
+    'gru_layers': 1,
+    'lstm_layers': 1,
+    'rnn_layers': 1,
+    'dense_layers': 1,
+    'gru_units': [DEFAULT_GRU_UNITS],
+    'lstm_units': [DEFAULT_LSTM_UNITS],
+    'rnn_units': [DEFAULT_RNN_UNITS],
+    'dense_units': [DEFAULT_DENSE_UNITS],
+    'learning_rate': DEFAULT_LEARNING_RATE,
+    'hybrid_models': ["GRU"],
+    'prediction_horizon': DEFAULT_PREDICTION_HORIZON,
+    'num_samples': 100,
+    **dict.fromkeys([
+        'metrics', 'train_results_df', 'test_results_df', 'fig', 'model_plot', 'scaler',
+        'new_predictions_df', 'new_fig', 'new_data_file', 'selected_inputs', 'new_date_col',
+        'selected_metrics', 'new_var_types', 'cv_metrics', 'X_train', 'y_train', 'X_test',
+        'y_test', 'model', 'use_attention', 'use_bidirectional', 'use_residual', 'dropout_rate',
+        'y_min', 'y_range', 'cached_Xy', 'model_sig', 'plot_png', 'train_csv', 'test_csv'
+    ])
+}
+
+# -------------------- TensorFlow Configuration --------------------
+def mixed_precision_policy():
+    """bfloat16 on TPUs and Ampere+ GPUs, float16 on older GPUs, float32 without an accelerator."""
+    tf = lazy_import('tensorflow')
+    gpus = tf.config.list_physical_devices('GPU')
+    if not gpus and not tf.config.list_physical_devices('TPU'):
+        return 'float32'
+    if gpus and all(tf.config.experimental.get_device_details(gpu).get('compute_capability', (0, 0)) < (8, 0)
+                    for gpu in gpus):
+        return 'mixed_float16'
+    return 'mixed_bfloat16'
+
+def configure_precision(use_mixed_precision):
+    """Set the global Keras dtype policy and enable TF32 matmuls."""
+    tf = lazy_import('tensorflow')
+    tf.keras.mixed_precision.set_global_policy(mixed_precision_policy() if use_mixed_precision else 'float32')
+    tf.config.experimental.enable_tensor_float_32_execution(True)
+
+def configure_tensorflow(use_mixed_precision):
+    """Apply the Performance settings before models are built or run."""
+    # XLA stays per model (jit_compile); process-wide auto-clustering would leak into other sessions
+    configure_precision(use_mixed_precision)
 
 # -------------------- PINN Loss Functions --------------------
 def physics_loss(y_true, y_pred):
     """Physics-based loss function for streamflow prediction."""
+    tf = lazy_import('tensorflow')
     # Mass conservation constraint
     mass_loss = tf.reduce_mean(tf.abs(tf.reduce_sum(y_pred) - tf.reduce_sum(y_true)))
     
@@ -145,6 +344,7 @@ def physics_loss(y_true, y_pred):
 
 def combined_loss(y_true, y_pred):
     """Combined MSE and physics loss."""
+    tf = lazy_import('tensorflow')
     mse_loss = tf.keras.losses.mean_squared_error(y_true, y_pred)
     phys_loss = physics_loss(y_true, y_pred)
     return mse_loss + DEFAULT_PHYSICS_WEIGHT * phys_loss
@@ -181,64 +381,183 @@ all_metrics_dict = {
     "MAPE": mape
 }
 
-# -------------------- Advanced Custom Callbacks --------------------
-class StreamlitProgressCallback(tf.keras.callbacks.Callback):
-    def __init__(self, total_epochs, progress_placeholder, metrics_placeholder):
-        super().__init__()
-        self.total_epochs = total_epochs
-        self.progress_placeholder = progress_placeholder
-        self.metrics_placeholder = metrics_placeholder
-        self.current_epoch = 0
-        self.metrics_history = []
-
-    def on_epoch_end(self, epoch, logs=None):
-        self.current_epoch = epoch + 1
-        progress = self.current_epoch / self.total_epochs
-        self.progress_placeholder.progress(min(progress, 1.0))
-        
-        # Update metrics display
-        metrics_text = f"Epoch {self.current_epoch}/{self.total_epochs}\n"
-        for metric, value in logs.items():
-            metrics_text += f"{metric}: {value:.4f}\n"
-        self.metrics_placeholder.text(metrics_text)
-        
-        # Store metrics history
-        self.metrics_history.append(logs)
-
-class AdvancedModelCheckpoint(tf.keras.callbacks.ModelCheckpoint):
-    def __init__(self, filepath, monitor='val_loss', verbose=1, save_best_only=True, mode='min'):
-        super().__init__(filepath, monitor, verbose, save_best_only, mode)
-        self.best_epoch = 0
-        self.best_value = float('inf')
-
-    def on_epoch_end(self, epoch, logs=None):
-        current = logs.get(self.monitor)
-        if current is None:
-            return
-
-        if self.mode == 'min':
-            if current < self.best_value:
-                self.best_value = current
-                self.best_epoch = epoch
-                super().on_epoch_end(epoch, logs)
-        else:
-            if current > self.best_value:
-                self.best_value = current
-                self.best_epoch = epoch
-                super().on_epoch_end(epoch, logs)
+@functools.lru_cache(maxsize=None)
+def numba_metric_kernel():
+    """Compile the single-pass metric accumulator on first use."""
+    numba = lazy_import('numba')
+
+    # Reassociation lets the reductions vectorize without assuming away inf/NaN
+    @numba.njit(fastmath={'reassoc', 'contract'})
+    def kernel(a, p):
+        n = a.shape[0]
+        shift_a, shift_p = a[0], p[0]  # Shifted sums keep the one-pass variances stable
+        s_a = s_p = s_aa = s_pp = s_ap = s_sq = s_abs = s_ape = 0.0
+        for i in range(n):
+            da, dp, e = a[i] - shift_a, p[i] - shift_p, p[i] - a[i]
+            s_a += da
+            s_p += dp
+            s_aa += da * da
+            s_pp += dp * dp
+            s_ap += da * dp
+            s_sq += e * e
+            s_abs += abs(e)
+            s_ape += abs(e / a[i])
+        m_a, m_p = s_a / n, s_p / n
+        return (m_a + shift_a, m_p + shift_p, s_aa / n - m_a * m_a, s_pp / n - m_p * m_p,
+                s_ap / n - m_a * m_p, s_sq / n, s_abs / n, s_ape / n)
+    return kernel
+
+def metric_moments(actual, predicted):
+    """Means, variances, covariance and error means shared by every metric."""
+    # The numba kernel indexes the first element; empty inputs take the NumPy path and yield NaN
+    if USE_NUMBA and len(actual):
+        return numba_metric_kernel()(actual, predicted)
+    err = predicted - actual
+    actual_mean, pred_mean = actual.mean(), predicted.mean()
+    actual_dev, pred_dev = actual - actual_mean, predicted - pred_mean
+    abs_err = np.abs(err)
+    return (actual_mean, pred_mean, np.mean(actual_dev * actual_dev), np.mean(pred_dev * pred_dev),
+            np.mean(actual_dev * pred_dev), np.mean(err * err), abs_err.mean(), np.mean(abs_err / np.abs(actual)))
+
+def compute_metrics(actual, predicted, names):
+    """Evaluate the named metrics from one set of shared error intermediates."""
+    actual = np.ascontiguousarray(actual, dtype=np.float64).ravel()
+    predicted = np.ascontiguousarray(predicted, dtype=np.float64).ravel()
+    actual_mean, pred_mean, actual_var, pred_var, cov, sq_mean, abs_mean, ape_mean = metric_moments(actual, predicted)
+    skill = 1 - sq_mean / actual_var
+
+    def kge_value():
+        r = cov / np.sqrt(actual_var * pred_var)
+        alpha = np.sqrt(pred_var / actual_var)
+        beta = pred_mean / actual_mean
+        return 1 - np.sqrt((r - 1) ** 2 + (alpha - 1) ** 2 + (beta - 1) ** 2)
+
+    derived = {
+        "RMSE": lambda: np.sqrt(sq_mean),
+        "MAE": lambda: abs_mean,
+        "R²": lambda: skill,
+        "NSE": lambda: skill,
+        "KGE": kge_value,
+        "MAPE": lambda: ape_mean * 100,
+    }
+    return {name: float(derived[name]()) for name in names}
 
 # -------------------- Advanced Model Definition --------------------
 def build_advanced_model(input_shape, model_type, layers, units, dense_layers, dense_units, learning_rate, 
-                        use_attention=False, use_bidirectional=False, use_residual=False, dropout_rate=0.2):
+                        use_attention=False, use_bidirectional=False, use_residual=False, dropout_rate=0.2,
+                        jit_compile=True):
     return get_uncertainty_model(input_shape, model_type, layers, units, dense_layers, dense_units,
-                               learning_rate, use_attention, use_bidirectional, use_residual, dropout_rate)
+                               learning_rate, use_attention, use_bidirectional, use_residual, dropout_rate,
+                               jit_compile)
+
+# -------------------- Fast Scaling --------------------
+@dataclass
+class FastMinMaxScaler:
+    """Min-max scaler that works in place on float32 buffers."""
+    data_min: np.ndarray
+    data_range: np.ndarray
+
+    @classmethod
+    def fit(cls, arr):
+        data_min = arr.min(axis=0)
+        data_range = arr.max(axis=0) - data_min
+        data_range[data_range == 0] = 1
+        return cls(data_min, data_range)
+
+    def transform(self, x, out=None):
+        if out is None:
+            out = np.array(x, dtype=np.float32, copy=True)
+        elif out is not x:
+            out[...] = x
+        np.subtract(out, self.data_min, out=out)
+        np.divide(out, self.data_range, out=out)
+        return out
+
+    def inverse_transform(self, x):
+        out = np.array(x, dtype=np.float32, copy=True)
+        np.multiply(out, self.data_range, out=out)
+        np.add(out, self.data_min, out=out)
+        return out
+
+def inverse_scale_target(values, y_min, y_range):
+    """Undo min-max scaling of the target column in place on a float32 copy."""
+    out = np.array(values, dtype=np.float32).reshape(-1)
+    np.multiply(out, y_range, out=out)
+    np.add(out, y_min, out=out)
+    return out
+
+# Opt-in fused Numba kernel; the JIT cost is paid once per server process
+BOTTLENECK_AVAILABLE = importlib.util.find_spec('bottleneck') is not None
+USE_NUMBA = os.environ.get('WATERAN_NUMBA', '0') == '1' and importlib.util.find_spec('numba') is not None
+
+@functools.lru_cache(maxsize=None)
+def numba_scale_split_kernel():
+    """Compile the fused scale + split kernel on first use."""
+    numba = lazy_import('numba')
+
+    @numba.njit(parallel=True, fastmath=True)
+    def kernel(raw, mins, ranges, out_X, out_y):
+        n, f = out_X.shape[0], out_X.shape[2]
+        for i in numba.prange(n):
+            for j in range(f):
+                out_X[i, 0, j] = (raw[i, j] - mins[j]) / ranges[j]
+            out_y[i, 0] = (raw[i, f] - mins[f]) / ranges[f]
+    return kernel
+
+def scale_split(arr, scaler):
+    """Scale a float32 [features..., target] array into (N, 1, F) inputs and (N, 1) targets."""
+    n, f = arr.shape[0], arr.shape[1] - 1
+    if USE_NUMBA:
+        X = np.empty((n, 1, f), dtype=np.float32)
+        y = np.empty((n, 1), dtype=np.float32)
+        numba_scale_split_kernel()(arr, scaler.data_min, scaler.data_range, X, y)
+        return X, y
+    scaled = scaler.transform(arr, out=arr)
+    return np.ascontiguousarray(scaled[:, :-1]).reshape(n, 1, f), np.ascontiguousarray(scaled[:, -1:])
+
+def scale_features(arr, scaler):
+    """Scale a float32 feature-only array into (N, 1, F) inputs using the scaler's feature columns."""
+    np.subtract(arr, scaler.data_min[:-1], out=arr)
+    np.divide(arr, scaler.data_range[:-1], out=arr)
+    return arr.reshape(arr.shape[0], 1, -1)
+
+SEQUENCE_MODEL_TYPES = ("GRU", "LSTM", "RNN")
+
+def sequence_layout(feature_cols, num_lags):
+    """Column indices arranging lag features as (timesteps, channels), oldest lag first; other features repeat each step."""
+    pos = {col: i for i, col in enumerate(feature_cols)}
+    lagged = list(dict.fromkeys(col.split('_Lag_')[0] for col in feature_cols if '_Lag_' in col))
+    others = [i for i, col in enumerate(feature_cols) if '_Lag_' not in col]
+    return np.array([[pos[f'{var}_Lag_{lag}'] for var in lagged] + others for lag in range(num_lags, 0, -1)])
+
+def input_layout(feature_cols):
+    """Timestep layout for the current model, or None to keep single-step (N, 1, F) inputs."""
+    ss = st.session_state
+    if ss.sequence_input and ss.model_type in SEQUENCE_MODEL_TYPES and ss.num_lags > 0:
+        return sequence_layout(feature_cols, ss.num_lags)
+    return None
+
+def to_sequences(X, layout):
+    """Gather (N, 1, F) inputs into (N, T, C) sequences when a layout is given."""
+    return X if layout is None else X[:, 0, :][:, layout]
 
 # -------------------- Advanced Data Preprocessing --------------------
+def lag_features(df, cols, num_lags):
+    """Build `{col}_Lag_{n}` columns for lags 1..num_lags from one sliding-window view."""
+    names = [f'{col}_Lag_{lag}' for col in cols for lag in range(1, num_lags + 1)]
+    arr = df[cols].to_numpy(dtype=np.float32)
+    # NaN padding reproduces shift() at the start of the series
+    padded = np.concatenate([np.full((num_lags, len(cols)), np.nan, dtype=np.float32), arr])
+    # windows[t, c] holds rows t-num_lags..t; reversing all but the last gives lags 1..num_lags
+    windows = np.lib.stride_tricks.sliding_window_view(padded, num_lags + 1, axis=0)
+    out = windows[..., :-1][..., ::-1].reshape(len(arr), len(names))
+    return pd.DataFrame(out, index=df.index, columns=names)
+
 def preprocess_data(df, input_vars, output_var, var_types, num_lags, date_col=None, 
                    handle_missing='median', remove_outliers=True, outlier_threshold=3):
     """Advanced data preprocessing with multiple options."""
     try:
-        processed_df = df.copy()
+        processed_df = df.copy(deep=False)
         
         # Ensure input_vars and output_var exist in the dataframe
         missing_cols = [col for col in input_vars + [output_var] if col not in processed_df.columns]
@@ -264,34 +583,41 @@ def preprocess_data(df, input_vars, output_var, var_types, num_lags, date_col=No
         
         # Remove outliers - only if remove_outliers is True (boolean check)
         if isinstance(remove_outliers, bool) and remove_outliers:
-            for var in input_vars + [output_var]:
-                # Use try-except to handle cases where zscore fails
-                try:
-                    z_scores = stats.zscore(processed_df[var])
-                    processed_df[var] = processed_df[var].mask(abs(z_scores) > outlier_threshold)
-                    processed_df[var] = processed_df[var].fillna(processed_df[var].median())
-                except:
-                    pass
+            model_vars = input_vars + [output_var]
+            # Use try-except to handle cases where zscore fails
+            try:
+                # One vectorized z-score pass over all columns
+                values = processed_df[model_vars].to_numpy(dtype=np.float32)
+                z_scores = np.abs(lazy_import('scipy.stats').zscore(values, axis=0, nan_policy='omit'))
+                outliers = pd.DataFrame(z_scores > outlier_threshold, index=processed_df.index, columns=model_vars)
+                masked = processed_df[model_vars].mask(outliers)
+                processed_df[model_vars] = masked.fillna(masked.median())
+            except:
+                pass
         
-        # Create lagged features
+        # Create lagged features for dynamic inputs and the output variable
         feature_cols = []
         for var in input_vars:
             if var in var_types and var_types[var] == "Dynamic":
-                for lag in range(1, num_lags + 1):
-                    processed_df[f'{var}_Lag_{lag}'] = processed_df[var].shift(lag)
-                    feature_cols.append(f'{var}_Lag_{lag}')
+                feature_cols.extend(f'{var}_Lag_{lag}' for lag in range(1, num_lags + 1))
             else:
                 feature_cols.append(var)
+        feature_cols.extend(f'{output_var}_Lag_{lag}' for lag in range(1, num_lags + 1))
         
-        # Add output variable lags
-        for lag in range(1, num_lags + 1):
-            processed_df[f'{output_var}_Lag_{lag}'] = processed_df[output_var].shift(lag)
-            feature_cols.append(f'{output_var}_Lag_{lag}')
+        lag_vars = list(dict.fromkeys(
+            [var for var in input_vars if var_types.get(var) == "Dynamic"] + [output_var]
+        ))
+        lags = lag_features(processed_df, lag_vars, num_lags)
+        processed_df = pd.concat([processed_df.drop(columns=lags.columns, errors='ignore'), lags], axis=1)
         
-        # Remove rows with NaN values from lagged features
+        # Remove rows with NaN values from lagged features; without gaps in the
+        # lagged source columns only the first num_lags rows have any
         lag_cols = [col for col in feature_cols if "_Lag_" in col]
         if lag_cols:
-            processed_df = processed_df.dropna(subset=lag_cols, how='any')
+            if processed_df[lag_vars].isna().to_numpy().any():
+                processed_df = processed_df.dropna(subset=lag_cols, how='any')
+            else:
+                processed_df = processed_df.iloc[num_lags:]
         
         # Fill remaining NaN values
         processed_df = processed_df.fillna(0)
@@ -302,6 +628,21 @@ def preprocess_data(df, input_vars, output_var, var_types, num_lags, date_col=No
         return df, input_vars
 
 # -------------------- Advanced Feature Engineering --------------------
+def rolling_features(df, cols, window=3):
+    """Rolling mean/std (min_periods=1, ddof=1) for all columns in one float32 matrix pass."""
+    arr = df[cols].to_numpy(dtype=np.float32)
+    if BOTTLENECK_AVAILABLE:
+        bn = lazy_import('bottleneck')
+        means = bn.move_mean(arr, window=window, min_count=1, axis=0)
+        stds = bn.move_std(arr, window=window, min_count=1, axis=0, ddof=1)
+    else:
+        frame = pd.DataFrame(arr).rolling(window=window, min_periods=1)
+        means, stds = frame.mean().to_numpy(), frame.std().to_numpy()
+    # Interleave as [mean, std] per column to keep the original column order
+    out = np.stack([means, stds], axis=2).reshape(len(arr), -1)
+    names = [f'{col}_rolling_{stat}_{window}' for col in cols for stat in ('mean', 'std')]
+    return pd.DataFrame(out, index=df.index, columns=names)
+
 def engineer_features(df, feature_cols, output_var, date_col=None):
     """Add engineered features to the dataset."""
     try:
@@ -315,7 +656,7 @@ def engineer_features(df, feature_cols, output_var, date_col=None):
         if output_var not in df.columns:
             return df
             
-        engineered_df = df.copy()
+        engineered_df = df.copy(deep=False)
         
         # Time-based features if date column is available
         if date_col and date_col in engineered_df.columns:
@@ -333,16 +674,17 @@ def engineer_features(df, feature_cols, output_var, date_col=None):
             except:
                 pass
         
-        # Rolling statistics
-        for var in feature_cols:
-            if '_Lag_' in var:
-                try:
-                    base_var = var.split('_Lag_')[0]
-                    if base_var in engineered_df.columns:
-                        engineered_df[f'{base_var}_rolling_mean_3'] = engineered_df[base_var].rolling(window=3, min_periods=1).mean()
-                        engineered_df[f'{base_var}_rolling_std_3'] = engineered_df[base_var].rolling(window=3, min_periods=1).std()
-                except:
-                    pass
+        # Rolling statistics, once per base variable of the lagged features
+        base_vars = list(dict.fromkeys(
+            var.split('_Lag_')[0] for var in feature_cols if '_Lag_' in var
+        ))
+        base_vars = [var for var in base_vars if var in engineered_df.columns]
+        if base_vars:
+            try:
+                rolling = rolling_features(engineered_df, base_vars, window=3)
+                engineered_df = pd.concat([engineered_df.drop(columns=rolling.columns, errors='ignore'), rolling], axis=1)
+            except:
+                pass
         
         # Interaction features - limit to avoid explosion of features
         valid_features = [f for f in feature_cols if f in engineered_df.columns]
@@ -365,10 +707,75 @@ def engineer_features(df, feature_cols, output_var, date_col=None):
     except:
         return df
 
+# -------------------- Cached Preparation --------------------
+def hash_frame(df):
+    """Content hash for DataFrame cache keys, including column names."""
+    return tuple(df.columns), pd.util.hash_pandas_object(df).values.tobytes()
+
+def preparation_key(df):
+    """Identify a dataset together with the preprocessing settings applied to it."""
+    ss = st.session_state
+    data_hash = hashlib.sha1(pd.util.hash_pandas_object(df).values.tobytes()).hexdigest()
+    return (data_hash, tuple(df.columns), tuple(ss.input_vars), ss.output_var, tuple(sorted(ss.var_types.items())),
+            ss.num_lags, ss.date_col, ss.handle_missing, ss.remove_outliers, ss.outlier_threshold,
+            ss.enable_feature_engineering, ss.sequence_input and ss.model_type in SEQUENCE_MODEL_TYPES)
+
+@st.cache_data(hash_funcs={pd.DataFrame: hash_frame}, show_spinner=False)
+def prepare_features(df, input_vars, output_var, var_types, num_lags, date_col, handle_missing,
+                     remove_outliers, outlier_threshold, enable_feature_engineering):
+    """Preprocess and optionally feature-engineer a frame, memoized on its content and settings."""
+    processed_df, feature_cols = preprocess_data(
+        df, input_vars, output_var, var_types, num_lags, date_col,
+        handle_missing, remove_outliers, outlier_threshold
+    )
+    if enable_feature_engineering:
+        try:
+            processed_df = engineer_features(processed_df, feature_cols, output_var, date_col)
+        except Exception:
+            # Silently continue with basic features
+            pass
+    return processed_df, feature_cols
+
+@st.cache_data(hash_funcs={pd.DataFrame: hash_frame}, show_spinner=False)
+def split_and_scale(processed_df, model_cols, train_split, scaler=None, layout=None):
+    """Split chronologically and scale into (N, 1, F) sequences, fitting the scaler on train unless given."""
+    train_size = int(len(processed_df) * train_split)
+    # One float32 conversion; the splits are row views of it
+    arr = processed_df[model_cols].to_numpy(dtype=np.float32, copy=True)
+    train_arr, test_arr = arr[:train_size], arr[train_size:]
+    if scaler is None:
+        scaler = FastMinMaxScaler.fit(train_arr)
+    X_train, y_train = scale_split(train_arr, scaler)
+    X_test, y_test = scale_split(test_arr, scaler)
+    return scaler, to_sequences(X_train, layout), y_train, to_sequences(X_test, layout), y_test
+
+@st.cache_data(hash_funcs={pd.DataFrame: hash_frame}, show_spinner=False)
+def csv_bytes(df):
+    """Serialize a results frame to CSV bytes with Arrow's C++ writer."""
+    pa = lazy_import('pyarrow')
+    pa_csv = lazy_import('pyarrow.csv')
+    buf = BytesIO()
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object columns: pandas writes UTF-8 straight into the buffer
+        df.to_csv(buf, index=False, lineterminator='\n')
+        return buf.getvalue()
+    # Whole-second timestamps instead of Arrow's nanosecond default; sub-second values keep their unit
+    for i, field in enumerate(table.schema):
+        if pa.types.is_timestamp(field.type):
+            try:
+                table = table.set_column(i, field.name, table.column(i).cast(pa.timestamp('s', field.type.tz)))
+            except pa.ArrowInvalid:
+                pass
+    pa_csv.write_csv(table, buf)
+    return buf.getvalue()
+
 # -------------------- Advanced Visualization --------------------
 def plot_advanced_metrics(metrics_history):
     """Create advanced visualization of training metrics."""
-    fig = make_subplots(rows=2, cols=2, subplot_titles=('Loss', 'Learning Rate', 'RMSE', 'R²'))
+    go = lazy_import('plotly.graph_objects')
+    fig = lazy_import('plotly.subplots').make_subplots(rows=2, cols=2, subplot_titles=('Loss', 'Learning Rate', 'RMSE', 'R²'))
     
     # Loss plot
     fig.add_trace(
@@ -402,20 +809,37 @@ def plot_advanced_metrics(metrics_history):
     fig.update_layout(height=800, showlegend=True)
     return fig
 
+def plot_axis(dates):
+    """Typed x values for WebGL traces: datetimes at millisecond resolution, anything else unchanged."""
+    dates = np.asarray(dates)
+    return dates.astype('datetime64[ms]') if np.issubdtype(dates.dtype, np.datetime64) else dates
+
+def confidence_band(dates, mean, std, z=1.96):
+    """Closed polygon coordinates (upper bound out, lower bound back) for a filled interval trace."""
+    dates = np.asarray(dates)
+    mean, std = np.asarray(mean), np.asarray(std)
+    return (np.concatenate([dates, dates[::-1]]),
+            np.concatenate([mean + z * std, (mean - z * std)[::-1]]))
+
 def plot_prediction_with_uncertainty(dates, actual, predicted_mean, predicted_std, title):
     """Create visualization with prediction uncertainty."""
+    go = lazy_import('plotly.graph_objects')
     fig = go.Figure()
+    # WebGL traces over float32 arrays keep long series light in the browser
+    dates = plot_axis(dates)
+    predicted_mean = np.asarray(predicted_mean, dtype=np.float32)
+    predicted_std = np.asarray(predicted_std, dtype=np.float32)
     
     # Actual values
-    fig.add_trace(go.Scatter(
+    fig.add_trace(go.Scattergl(
         x=dates,
-        y=actual,
+        y=np.asarray(actual, dtype=np.float32),
         name='Actual',
         line=dict(color='blue')
     ))
     
     # Predicted mean
-    fig.add_trace(go.Scatter(
+    fig.add_trace(go.Scattergl(
         x=dates,
         y=predicted_mean,
         name='Predicted',
@@ -423,10 +847,10 @@ def plot_prediction_with_uncertainty(dates, actual, predicted_mean, predicted_st
     ))
     
     # Confidence intervals
-    fig.add_trace(go.Scatter(
-        x=dates.tolist() + dates[::-1].tolist(),
-        y=(predicted_mean + 1.96 * predicted_std).tolist() + 
-          (predicted_mean - 1.96 * predicted_std)[::-1].tolist(),
+    band_x, band_y = confidence_band(dates, predicted_mean, predicted_std)
+    fig.add_trace(go.Scattergl(
+        x=band_x,
+        y=band_y,
         fill='toself',
         fillcolor='rgba(255,0,0,0.1)',
         line=dict(color='rgba(255,0,0,0)'),
@@ -443,44 +867,108 @@ def plot_prediction_with_uncertainty(dates, actual, predicted_mean, predicted_st
     return fig
 
 # -------------------- Advanced Model Training --------------------
+def make_dataset(X, y, batch_size, shuffle=False):
+    """Build a cached, prefetched tf.data pipeline from in-memory arrays."""
+    tf = lazy_import('tensorflow')
+    dataset = tf.data.Dataset.from_tensor_slices((X, y)).cache()
+    if shuffle:
+        dataset = dataset.shuffle(min(len(X), 8192))
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
 def train_advanced_model(model, X_train, y_train, X_val, y_val, epochs, batch_size, callbacks):
     """Train model with advanced features."""
     history = model.fit(
-        X_train, y_train,
-        validation_data=(X_val, y_val),
+        make_dataset(X_train, y_train, batch_size, shuffle=True),
+        validation_data=make_dataset(X_val, y_val, batch_size),
         epochs=epochs,
-        batch_size=batch_size,
         callbacks=callbacks,
         verbose=1
     )
     return history
 
 # -------------------- Advanced Prediction --------------------
-def predict_with_uncertainty(model, X, num_samples=100):
-    """Generate predictions with uncertainty estimation using ensemble approach."""
+def fast_predict(model, X, batch_size=1024):
+    """Run inputs that fit in one batch through predict_on_batch, skipping predict()'s pipeline."""
+    if len(X) <= batch_size:
+        return np.asarray(model.predict_on_batch(X))
+    return model.predict(X, batch_size=batch_size, verbose=0)
+
+# Compiled Monte Carlo steps per live model, keyed by jit_compile
+_MC_STEP_CACHE = weakref.WeakKeyDictionary()
+_MC_STEP_LOCK = threading.Lock()  # New-data worker threads must not trace the same step twice
+MC_ROW_BLOCK = 4096
+MC_TILE_ROWS = 65536  # Upper bound on tiled rows per forward pass
+MC_SAMPLE_BLOCK = 8  # Samples per forward pass; convergence is checked after each block
+MC_MIN_SAMPLES = 32  # Samples always drawn so the reported uncertainty is not a handful-of-samples estimate
+MC_ABS_TOL = 0.005  # Stop once every mean's standard error is below this, in scaled target units (fraction of the training range)
+
+def mc_step_fn(model, jit_compile=True):
+    """Return a cached tf.function running n noisy forward passes of a Keras model in one graph."""
+    jit_compile = jit_compile and not has_recurrent_layers(model)
+    with _MC_STEP_LOCK:
+        steps = _MC_STEP_CACHE.setdefault(model, {})
+        if jit_compile not in steps:
+            tf = lazy_import('tensorflow')
+            # A fixed signature traces once for every row count and sample count
+            signature = [tf.TensorSpec([None] + list(model.input_shape[1:]), tf.float32), tf.TensorSpec([], tf.int32)]
+        
+            @tf.function(input_signature=signature, jit_compile=jit_compile)
+            def mc_step(x, n):
+                noisy = tf.expand_dims(x, 0) + tf.random.normal(tf.concat([[n], tf.shape(x)], 0), stddev=0.01)
+                pred = model(tf.reshape(noisy, tf.concat([[-1], tf.shape(x)[1:]], 0)), training=False)
+                return tf.reshape(tf.cast(pred, tf.float32), [n, -1])
+            steps[jit_compile] = mc_step
+    return steps[jit_compile]
+
+def predict_with_uncertainty(model, X, num_samples=100, samples_per_chunk=None, jit_compile=True, return_count=False):
+    """Generate predictions with uncertainty estimation using ensemble approach (optionally with the samples drawn)."""
     if len(X) > 1000:  # Reduce samples for large datasets
         num_samples = min(10, num_samples)
     
-    predictions = []
-    batch_size = min(1000, len(X))  # Use batching for large datasets
+    X = np.asarray(X, dtype=np.float32)
+    if samples_per_chunk is None:
+        # Small fixed blocks so the convergence check can stop early, capped by the tile budget
+        samples_per_chunk = max(1, min(MC_SAMPLE_BLOCK, MC_TILE_ROWS // max(1, min(len(X), MC_ROW_BLOCK))))
+    # Our SavedModel export carries a Monte Carlo signature; TensorRT and TFLite engines run the host loop over their converted graph
+    mc_step = mc_step_fn(model, jit_compile) if isinstance(model, keras_api().Model) else getattr(model, 'mc_step', None)
     
-    for _ in range(num_samples):
-        # Add noise to input
-        X_noisy = X + np.random.normal(0, 0.01, X.shape)
-        # Get predictions in batches
-        batch_predictions = []
-        for i in range(0, len(X), batch_size):
-            batch = X_noisy[i:i + batch_size]
-            pred = model.predict(batch, verbose=0)
-            batch_predictions.append(pred)
-        predictions.append(np.concatenate(batch_predictions))
+    # Running Welford statistics merged chunk by chunk
+    n_seen, mean_pred, m2 = 0, None, None
+    for start in range(0, num_samples, samples_per_chunk):
+        n = min(samples_per_chunk, num_samples - start)
+        if mc_step is not None:
+            # Noise, tiling and the forward pass run as a single compiled graph per row block
+            pred = np.concatenate(
+                [mc_step(X[i:i + MC_ROW_BLOCK], n).numpy() for i in range(0, len(X), MC_ROW_BLOCK)], axis=1
+            )
+        else:
+            # Tile n noisy copies of the input into a single forward pass
+            X_noisy = np.broadcast_to(X, (n,) + X.shape) + np.random.normal(0, 0.01, (n,) + X.shape).astype(np.float32)
+            pred = fast_predict(model, X_noisy.reshape((-1,) + X.shape[1:]))
+        pred = pred.reshape(n, len(X)).astype(np.float64)
+        
+        chunk_mean = pred.mean(axis=0)
+        chunk_m2 = np.square(pred - chunk_mean).sum(axis=0)
+        if mean_pred is None:
+            mean_pred, m2 = chunk_mean, chunk_m2
+        else:
+            delta = chunk_mean - mean_pred
+            total = n_seen + n
+            mean_pred = mean_pred + delta * (n / total)
+            m2 = m2 + chunk_m2 + np.square(delta) * (n_seen * n / total)
+        n_seen += n
+        
+        # Skip the remaining chunks once every mean has converged
+        if MC_MIN_SAMPLES <= n_seen < num_samples:
+            std_error = np.sqrt(m2 / (n_seen * (n_seen - 1)))
+            if np.all(std_error <= MC_ABS_TOL):
+                break
     
     # Calculate statistics
-    predictions = np.array(predictions)
-    mean_pred = np.mean(predictions, axis=0)
-    std_pred = np.std(predictions, axis=0)
+    std_pred = np.sqrt(m2 / n_seen)
     
-    return mean_pred.reshape(-1), std_pred.reshape(-1)
+    mean_pred, std_pred = mean_pred.astype(np.float32).reshape(-1), std_pred.astype(np.float32).reshape(-1)
+    return (mean_pred, std_pred, n_seen) if return_count else (mean_pred, std_pred)
 
 def generate_future_predictions(model, last_sequence, scaler, feature_cols, num_steps, 
                               input_vars, output_var, var_types, num_lags):
@@ -490,7 +978,7 @@ def generate_future_predictions(model, last_sequence, scaler, feature_cols, num_
     
     for _ in range(num_steps):
         # Get prediction
-        pred = model.predict(current_sequence.reshape(1, -1, current_sequence.shape[-1]), verbose=0)
+        pred = fast_predict(model, current_sequence.reshape(1, -1, current_sequence.shape[-1]))
         future_predictions.append(pred[0][0])  # Extract scalar prediction
         
         # Update sequence for next prediction
@@ -501,6 +989,178 @@ def generate_future_predictions(model, last_sequence, scaler, feature_cols, num_
     
     return np.array(future_predictions)
 
+# -------------------- Optimized Inference --------------------
+class ServingModel:
+    """Wrap a SavedModel serving signature behind a Keras-like predict API."""
+    def __init__(self, loaded, signature_key='serving_default'):
+        self.loaded = loaded  # Keep the loaded object alive for its signature
+        self.signature = loaded.signatures[signature_key]
+        self.input_name = list(self.signature.structured_input_signature[1].keys())[0]
+
+    def __call__(self, x, training=False):
+        tf = lazy_import('tensorflow')
+        outputs = self.signature(**{self.input_name: tf.convert_to_tensor(x, dtype=tf.float32)})
+        return next(iter(outputs.values()))
+
+    @property
+    def input_shape(self):
+        return tuple(self.signature.structured_input_signature[1][self.input_name].shape)
+
+    def predict_on_batch(self, x):
+        return self(x).numpy()
+
+    def predict(self, x, batch_size=1024, verbose=0):
+        return np.concatenate([self(x[i:i + batch_size]).numpy() for i in range(0, len(x), batch_size)])
+
+class MonteCarloServingModel(ServingModel):
+    """ServingModel for our own SavedModel export, which also carries the Monte Carlo signature."""
+    def mc_step(self, x, n):
+        """Run the exported Monte Carlo signature (noise, tiling and forward pass in one graph)."""
+        tf = lazy_import('tensorflow')
+        outputs = self.loaded.signatures['mc'](x=tf.convert_to_tensor(x, dtype=tf.float32), n=tf.constant(n, tf.int32))
+        return next(iter(outputs.values()))
+
+def export_serving_model(model, export_dir):
+    """Save a SavedModel with the serving and Monte Carlo signatures traced once."""
+    tf = lazy_import('tensorflow')
+    x_spec = tf.TensorSpec([None] + list(model.input_shape[1:]), tf.float32, name='x')
+    module = tf.Module()
+    module.model = model
+    module.serve = tf.function(lambda x: model(x, training=False), input_signature=[x_spec])
+    module.mc = tf.function(mc_step_fn(model, jit_compile=False).python_function,
+                            input_signature=[x_spec, tf.TensorSpec([], tf.int32, name='n')])
+    tf.saved_model.save(module, export_dir, signatures={'serving_default': module.serve, 'mc': module.mc})
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def cached_trained_model(arch, weights_mtime):
+    """Build an architecture and load the trained weights once per weights-file version."""
+    model = build_advanced_model(*arch)
+    model.load_weights(MODEL_WEIGHTS_PATH)
+    return model
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def cached_full_model(model_mtime):
+    """Load the whole saved Keras model once per file version, without rebuilding it from settings."""
+    return lazy_import('tensorflow').keras.models.load_model(
+        MODEL_FULL_PATH, compile=False,
+        custom_objects={'PhysicsInformedLayer': keras_api().PhysicsInformedLayer}
+    )
+
+def model_signature(input_shape, model_type):
+    """Architecture-defining settings; the session model is reused while these are unchanged."""
+    ss = st.session_state
+    return (tuple(input_shape), model_type, ss[LAYERS_MAP[model_type]], tuple(ss[UNITS_MAP[model_type]]),
+            ss.dense_layers, tuple(ss.dense_units), ss.use_attention, ss.use_bidirectional, ss.use_residual)
+
+def load_inference_model(input_shape, model_type):
+    """Return the session's inference model, loading the saved Keras model or SavedModel before rebuilding."""
+    sig = model_signature(input_shape, model_type)
+    if st.session_state.model_sig not in (None, sig):
+        # Architecture settings changed since training: rebuild from them and the saved weights
+        st.session_state.model = st.session_state.trt_model = st.session_state.tflite_model = None
+    if st.session_state.trt_model is not None:
+        return st.session_state.trt_model
+    if st.session_state.tflite_model is not None:
+        return st.session_state.tflite_model
+    if st.session_state.model is None:
+        fresh_session = st.session_state.model_sig is None
+        # Saved models from a different feature set or lag count fall through to a rebuild
+        if fresh_session and os.path.exists(MODEL_FULL_PATH):
+            full_model = cached_full_model(os.path.getmtime(MODEL_FULL_PATH))
+            if tuple(full_model.input_shape[1:]) == tuple(input_shape):
+                st.session_state.model = full_model
+        if st.session_state.model is None and fresh_session and os.path.isdir(MODEL_SAVED_DIR):
+            served_model = MonteCarloServingModel(lazy_import('tensorflow').saved_model.load(MODEL_SAVED_DIR))
+            if tuple(served_model.input_shape[1:]) == tuple(input_shape):
+                st.session_state.model = served_model
+        if st.session_state.model is None:
+            arch = (
+                tuple(input_shape),
+                model_type,
+                st.session_state[LAYERS_MAP[model_type]],
+                tuple(st.session_state[UNITS_MAP[model_type]]),
+                st.session_state.dense_layers,
+                tuple(st.session_state.dense_units),
+                st.session_state.learning_rate,
+                st.session_state.use_attention,
+                st.session_state.use_bidirectional,
+                st.session_state.use_residual,
+                st.session_state.dropout_rate
+            )
+            st.session_state.model = cached_trained_model(arch, os.path.getmtime(MODEL_WEIGHTS_PATH))
+        st.session_state.model_sig = sig
+    return st.session_state.model
+
+def tensorrt_available():
+    """Check whether TF-TRT and a GPU are available."""
+    tf = lazy_import('tensorflow')
+    return bool(tf.config.list_physical_devices('GPU')) and hasattr(tf.experimental, 'tensorrt')
+
+def convert_to_tensorrt(saved_model_dir, trt_dir, sample_input):
+    """Convert a SavedModel to an FP16 TF-TRT engine and load it for inference."""
+    tf = lazy_import('tensorflow')
+    converter = tf.experimental.tensorrt.Converter(
+        input_saved_model_dir=saved_model_dir,
+        precision_mode='FP16'
+    )
+    converter.convert()
+    
+    def input_fn():
+        yield (tf.constant(sample_input, dtype=tf.float32),)
+    
+    converter.build(input_fn=input_fn)
+    converter.save(trt_dir)
+    return ServingModel(tf.saved_model.load(trt_dir))
+
+class TFLiteModel:
+    """Run a TFLite model behind a Keras-like predict API."""
+    def __init__(self, model_content):
+        tf = lazy_import('tensorflow')
+        self.interpreter = tf.lite.Interpreter(model_content=model_content, num_threads=os.cpu_count())
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.batch_rows = None
+        self.lock = threading.Lock()  # One interpreter is shared by the prediction worker threads
+
+    def predict_on_batch(self, x):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        with self.lock:
+            # Reallocate only when the batch size changes
+            if self.batch_rows != len(x):
+                self.interpreter.resize_tensor_input(self.input_index, x.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_rows = len(x)
+            self.interpreter.set_tensor(self.input_index, x)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index).copy()
+
+    def predict(self, x, batch_size=1024, verbose=0):
+        return np.concatenate([self.predict_on_batch(x[i:i + batch_size]) for i in range(0, len(x), batch_size)])
+
+def int8_cpu_available():
+    """Check for a CPU-only host with INT8 dot-product instructions (x86 VNNI or Arm dotprod)."""
+    if lazy_import('tensorflow').config.list_physical_devices('GPU'):
+        return False
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return any(flag in flags for flag in ('avx512_vnni', 'avx_vnni', 'asimddp'))
+
+def convert_to_tflite(model, tflite_path):
+    """Convert a Keras model to a dynamic-range INT8 TFLite model, save it and load it for inference."""
+    tf = lazy_import('tensorflow')
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    # Weights are stored as INT8; activations are quantized on the fly
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    # Recurrent layers may lower to TensorFlow ops without a builtin kernel
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+    model_content = converter.convert()
+    with open(tflite_path, 'wb') as f:
+        f.write(model_content)
+    return TFLiteModel(model_content)
+
 # -------------------- Advanced Model Evaluation --------------------
 def evaluate_model_advanced(model, X_test, y_test, scaler, feature_cols):
     """Advanced model evaluation with multiple metrics."""
@@ -523,14 +1183,93 @@ def evaluate_model_advanced(model, X_test, y_test, scaler, feature_cols):
     return metrics, mean_pred, std_pred
 
 # -------------------- Advanced Hyperparameter Optimization --------------------
-def objective(trial, X_train, y_train, X_val, y_val, model_type):
-    """Objective function for Optuna hyperparameter optimization."""
-    import tensorflow as tf
-    import numpy as np
+# Compiled models keyed by architecture, reused across trials of one study run
+_OPTUNA_MODEL_CACHE = {}
+
+# Weight attributes and the initializer attribute that draws them
+_WEIGHT_INITIALIZERS = (('kernel', 'kernel_initializer'), ('recurrent_kernel', 'recurrent_initializer'),
+                        ('bias', 'bias_initializer'))
+
+def reinitialize_weights(model):
+    """Draw fresh initial weights from each layer's own initializers, as building the model again would."""
+    layers = list(model._flatten_layers(include_self=False, recursive=True))
+    # RNN cells and Bidirectional halves hold the actual weights
+    layers += [getattr(layer, attr) for layer in layers
+               for attr in ('cell', 'forward_layer', 'backward_layer') if getattr(layer, attr, None) is not None]
+    for layer in layers:
+        for weight_attr, init_attr in _WEIGHT_INITIALIZERS:
+            var, initializer = getattr(layer, weight_attr, None), getattr(layer, init_attr, None)
+            if var is not None and callable(initializer):
+                # A fresh instance from config: an unseeded initializer repeats its values when called again
+                initializer = type(initializer).from_config(initializer.get_config())
+                var.assign(initializer(tuple(var.shape), dtype=var.dtype))
+
+def reset_model_state(model, pristine_weights, learning_rate):
+    """Re-draw initial weights and start a fresh optimizer state on a compiled model."""
+    # The snapshot covers weights without a known initializer (e.g. the PINN layer); the rest are drawn anew
+    # so reused architectures stay independent draws for the sampler and pruner
+    model.set_weights(pristine_weights)
+    reinitialize_weights(model)
+    # Under mixed_float16 the optimizer is a LossScaleOptimizer whose dynamic scale must survive;
+    # only the wrapped optimizer's iterations and slot variables restart
+    inner = getattr(model.optimizer, 'inner_optimizer', model.optimizer)
+    for var in inner.variables:
+        var.assign(lazy_import('tensorflow').zeros_like(var))
+    model.optimizer.learning_rate = learning_rate
+
+def get_training_model(arch):
+    """Reuse this session's compiled model for an unchanged architecture with freshly drawn initial weights."""
+    cache = st.session_state.train_model_cache
+    key = (arch, st.session_state.use_mixed_precision)
+    if key in cache:
+        model, pristine_weights = cache[key]
+        reset_model_state(model, pristine_weights, arch[6])
+        return model
+    model = build_advanced_model(*arch)
+    cache.clear()  # Keep only the latest architecture alive per session
+    cache[key] = (model, model.get_weights())
+    return model
+
+def get_trial_model(input_shape, model_type, num_layers, units, learning_rate, dropout_rate, jit_compile=True):
+    """Fetch a compiled model for an architecture, building its graph only once."""
+    key = (input_shape, model_type, num_layers, units)
+    cached = _OPTUNA_MODEL_CACHE.pop(key, None)
+    if cached is None:
+        model = build_advanced_model(
+            input_shape=input_shape,
+            model_type=model_type,
+            layers=num_layers,
+            units=[units] * num_layers,
+            dense_layers=1,
+            dense_units=[32],
+            learning_rate=learning_rate,
+            dropout_rate=dropout_rate,
+            jit_compile=jit_compile
+        )
+        return key, model, model.get_weights()
     
-    # Clear any existing TensorFlow session state
-    tf.keras.backend.clear_session()
+    model, pristine_weights = cached
+    reset_model_state(model, pristine_weights, learning_rate)
+    dropout_layers = [layer for layer in model.layers if isinstance(layer, keras_api().Dropout)]
+    if any(layer.rate != dropout_rate for layer in dropout_layers):
+        for layer in dropout_layers:
+            layer.rate = dropout_rate
+        model.train_function = None  # Retrace so the new dropout rate takes effect
+    return key, model, pristine_weights
+
+def make_progress_callback(progress_bar, total):
+    """Build an Optuna callback that advances a Streamlit progress bar per finished trial."""
+    ctx = get_script_run_ctx()
+    finished = itertools.count(1)
     
+    def callback(study, trial):
+        # With OPTUNA_N_JOBS > 1 trials finish on Optuna worker threads; attach the script context so UI updates land
+        add_script_run_ctx(threading.current_thread(), ctx)
+        progress_bar.progress(min(next(finished) / total, 1.0))
+    return callback
+
+def objective(trial, X_train, y_train, X_val, y_val, model_type, jit_compile=True):
+    """Objective function for Optuna hyperparameter optimization."""
     # Define hyperparameters to optimize with more focused ranges
     hp = {
         'learning_rate': trial.suggest_loguniform('learning_rate', 1e-4, 1e-2),
@@ -542,10 +1281,10 @@ def objective(trial, X_train, y_train, X_val, y_val, model_type):
     
     try:
         # Ensure input shapes are correct
-        X_train = np.array(X_train)
-        y_train = np.array(y_train)
-        X_val = np.array(X_val)
-        y_val = np.array(y_val)
+        X_train = np.asarray(X_train, dtype=np.float32)
+        y_train = np.asarray(y_train, dtype=np.float32)
+        X_val = np.asarray(X_val, dtype=np.float32)
+        y_val = np.asarray(y_val, dtype=np.float32)
         
         # Reshape inputs if needed
         if len(X_train.shape) == 2:
@@ -557,48 +1296,448 @@ def objective(trial, X_train, y_train, X_val, y_val, model_type):
         if len(y_val.shape) == 1:
             y_val = y_val.reshape(-1, 1)
         
-        # Build model with error handling
-        model = build_advanced_model(
-            input_shape=(X_train.shape[1], X_train.shape[2]),
-            model_type=model_type,
-            layers=hp['num_layers'],
-            units=[hp['units']] * hp['num_layers'],
-            dense_layers=1,
-            dense_units=[32],
-            learning_rate=hp['learning_rate'],
-            dropout_rate=hp['dropout_rate']
+        # Reuse a compiled model for this architecture when one exists
+        key, model, pristine_weights = get_trial_model(
+            (X_train.shape[1], X_train.shape[2]),
+            model_type,
+            hp['num_layers'],
+            hp['units'],
+            hp['learning_rate'],
+            hp['dropout_rate'],
+            jit_compile
         )
         
         # Train model with reduced epochs and earlier stopping
-        early_stopping = tf.keras.callbacks.EarlyStopping(
+        early_stopping = keras_api().EarlyStopping(
             monitor='val_loss',
             patience=5,
             restore_best_weights=True
         )
+        pruning = keras_api().OptunaPruningCallback(trial)
         
         history = model.fit(
-            X_train, y_train,
-            validation_data=(X_val, y_val),
+            make_dataset(X_train, y_train, hp['batch_size'], shuffle=True),
+            validation_data=make_dataset(X_val, y_val, hp['batch_size']),
             epochs=20,
-            batch_size=hp['batch_size'],
-            callbacks=[early_stopping],
+            callbacks=[early_stopping, pruning],
             verbose=0
         )
         
-        # Get the best validation loss
-        best_val_loss = min(history.history['val_loss'])
+        # Return the model to the cache for later trials
+        _OPTUNA_MODEL_CACHE[key] = (model, pristine_weights)
         
-        # Clean up
-        del model
-        tf.keras.backend.clear_session()
+        if pruning.pruned:
+            raise lazy_import('optuna').TrialPruned(f"Pruned at epoch {len(history.history['val_loss'])}")
         
-        return best_val_loss
+        # Get the best validation loss
+        return min(history.history['val_loss'])
     
+    except lazy_import('optuna').TrialPruned:
+        raise
     except Exception as e:
-        # Clean up on error
-        tf.keras.backend.clear_session()
         print(f"Trial error: {str(e)}")
-        raise optuna.exceptions.TrialPruned(f"Trial failed: {str(e)}")
+        raise lazy_import('optuna').exceptions.TrialPruned(f"Trial failed: {str(e)}")
+
+# -------------------- Data Loading --------------------
+PARQUET_CACHE_DIR = os.path.join(tempfile.gettempdir(), "wateran_parquet_cache")
+PARQUET_CACHE_MAX_BYTES = 512 * 1024 ** 2  # Least recently used mirrors are evicted beyond this
+PARQUET_TMP_MAX_AGE = 3600  # Seconds before an unfinished *.tmp write counts as orphaned
+EXCEL_ENGINE = 'calamine' if importlib.util.find_spec('python_calamine') else None
+
+def read_uploaded_file(raw_bytes, file_name):
+    """Parse an uploaded Excel, CSV, or JSON file with the fastest available engine."""
+    if file_name.endswith('.csv'):
+        return pd.read_csv(BytesIO(raw_bytes), engine='pyarrow')
+    elif file_name.endswith('.json'):
+        return pd.read_json(BytesIO(raw_bytes))
+    else:
+        return pd.read_excel(BytesIO(raw_bytes), engine=EXCEL_ENGINE)
+
+def downcast_floats(df):
+    """Store float64 columns as float32, the precision the model works in."""
+    float_cols = df.select_dtypes(include='float64').columns
+    if len(float_cols):
+        df[float_cols] = df[float_cols].astype(np.float32)
+    return df
+
+@st.cache_data
+def load_data(raw_bytes, file_name):
+    """Read an uploaded file, reusing a Parquet mirror keyed by its content hash."""
+    cache_path = os.path.join(PARQUET_CACHE_DIR, f"{hashlib.sha1(raw_bytes).hexdigest()}.parquet")
+    if os.path.exists(cache_path):
+        try:
+            os.utime(cache_path)  # Mark as recently used for eviction
+        except OSError:
+            pass
+        return downcast_floats(pd.read_parquet(cache_path))
+    df = downcast_floats(read_uploaded_file(raw_bytes, file_name))
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(PARQUET_CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        # Mixed-type columns cannot be stored as Parquet; the cache is optional
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    prune_parquet_cache()
+    return df
+
+def prune_parquet_cache():
+    """Evict the least recently used Parquet mirrors beyond the size budget and drop orphaned temp files."""
+    try:
+        entries = [entry for entry in os.scandir(PARQUET_CACHE_DIR) if entry.is_file()]
+    except OSError:
+        return
+    now = time.time()
+    mirrors = []
+    for entry in entries:
+        try:
+            stat = entry.stat()
+            if entry.name.endswith('.tmp'):
+                if now - stat.st_mtime > PARQUET_TMP_MAX_AGE:
+                    os.remove(entry.path)
+            elif entry.name.endswith('.parquet'):
+                mirrors.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            pass  # Removed concurrently by another session
+    total = sum(size for _, size, _ in mirrors)
+    for _, size, path in sorted(mirrors):
+        if total <= PARQUET_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+def is_date_name(col):
+    """Whether a column name looks like a date/time column."""
+    return "date" in str(col).lower()
+
+@st.cache_data
+def read_new_data(raw_bytes, file_name, wanted_cols, date_col=None):
+    """Read only the model's input/output columns plus the training date column and date-like ones from a new-data file."""
+    wanted = set(wanted_cols)
+    keep = lambda col: col in wanted or col == date_col or is_date_name(col)
+    keep_frame = lambda df: downcast_floats(df[[col for col in df.columns
+                                                if keep(col) or pd.api.types.is_datetime64_any_dtype(df[col])]])
+    if file_name.endswith('.csv'):
+        # Arrow infers the schema from the first block, so timestamp columns are kept whatever their name
+        pa = lazy_import('pyarrow')
+        schema = lazy_import('pyarrow.csv').open_csv(BytesIO(raw_bytes)).schema
+        usecols = [field.name for field in schema
+                   if keep(field.name) or pa.types.is_timestamp(field.type) or pa.types.is_date(field.type)]
+        numeric = {field.name: 'float32' for field in schema
+                   if field.name in wanted and (pa.types.is_floating(field.type) or pa.types.is_integer(field.type))}
+        try:
+            return pd.read_csv(BytesIO(raw_bytes), engine='pyarrow', usecols=usecols, dtype=numeric)
+        except ValueError:
+            return pd.read_csv(BytesIO(raw_bytes), engine='pyarrow', usecols=usecols)
+    elif file_name.endswith('.json'):
+        return keep_frame(pd.read_json(BytesIO(raw_bytes)))
+    else:
+        # Excel dtypes are only known after parsing, which reads every cell either way
+        return keep_frame(pd.read_excel(BytesIO(raw_bytes), engine=EXCEL_ENGINE))
+
+@st.cache_data
+def prepare_df(raw_bytes, file_name, date_col=None):
+    """Load a file and parse/sort its date column once per file content."""
+    df = load_data(raw_bytes, file_name)
+    if date_col:
+        df[date_col] = pd.to_datetime(df[date_col], cache=True)
+        if not df[date_col].is_monotonic_increasing:
+            df = df.sort_values(date_col, kind='mergesort')
+    return df
+
+@st.cache_data
+def exploration_tables(df, cols):
+    """Summary statistics and missing-value counts for the Data Exploration panel."""
+    missing = df.isnull().sum()
+    missing_df = pd.DataFrame({
+        'Column': df.columns,
+        'Missing Values': missing,
+        'Missing %': (missing / len(df) * 100).round(2)
+    })
+    return df[list(cols)].describe(), missing_df
+
+PNG_PIL_KWARGS = {'compress_level': 1, 'optimize': False}
+
+@st.cache_data
+def corr_heatmap_png(df, cols):
+    """Render the correlation heatmap of the given columns to PNG bytes."""
+    # A bare Figure renders through Agg without touching pyplot's global state
+    fig = lazy_import('matplotlib.figure').Figure()
+    ax = fig.subplots()
+    lazy_import('seaborn').heatmap(df[list(cols)].corr(), annot=True, cmap="coolwarm", ax=ax)
+    ax.set_title("Correlation Matrix")
+    # One layout pass instead of bbox_inches='tight' re-rendering, and cheap zlib settings
+    fig.tight_layout()
+    buf = BytesIO()
+    fig.savefig(buf, format='png', pil_kwargs=PNG_PIL_KWARGS)
+    return buf.getvalue()
+
+def agg_png_bytes(fig):
+    """Encode a bare matplotlib Figure to PNG from its Agg RGBA buffer via Pillow."""
+    canvas = lazy_import('matplotlib.backends.backend_agg').FigureCanvasAgg(fig)
+    canvas.draw()
+    buf = BytesIO()
+    lazy_import('PIL.Image').fromarray(np.asarray(canvas.buffer_rgba())).save(buf, format='PNG', **PNG_PIL_KWARGS)
+    return buf.getvalue()
+
+def var_types_editor(variables, current_types, key):
+    """Edit Dynamic/Static types for all variables in a single data_editor widget."""
+    types_df = pd.DataFrame({
+        'Variable': variables,
+        'Type': [current_types.get(var, "Dynamic") for var in variables]
+    })
+    edited = st.data_editor(
+        types_df,
+        column_config={
+            'Variable': st.column_config.TextColumn(disabled=True),
+            'Type': st.column_config.SelectboxColumn(options=["Dynamic", "Static"], required=True)
+        },
+        hide_index=True,
+        use_container_width=True,
+        # Keyed on the variable list so edits never carry over to a different selection
+        key=f"{key}_{'|'.join(variables)}"
+    )
+    return dict(zip(edited['Variable'], edited['Type']))
+
+def layer_sizes_input(label, current_units, key, max_layers=5):
+    """Edit a whole layer stack as one comma-separated text input; invalid input keeps the current sizes."""
+    text = st.text_input(label, ", ".join(map(str, current_units)), key=key)
+    try:
+        sizes = [int(x) for x in text.split(',') if x.strip()]
+    except ValueError:
+        sizes = []
+    if not 1 <= len(sizes) <= max_layers or not all(8 <= u <= 512 for u in sizes):
+        st.warning(f"{label}: enter 1-{max_layers} comma-separated sizes between 8 and 512.")
+        return list(current_units)
+    return sizes
+
+# -------------------- New Data Prediction --------------------
+NEW_DATA_MAX_WORKERS = 4
+
+def predict_new_file(new_df, selected_inputs, var_types, inference_model, settings):
+    """Build lag features for one new-data file and run Monte Carlo inference on it (thread-safe)."""
+    feature_cols_new = []
+    for var in selected_inputs:
+        if var_types[var] == "Dynamic":
+            feature_cols_new.extend(f'{var}_Lag_{lag}' for lag in range(1, settings.num_lags + 1))
+        else:
+            feature_cols_new.append(var)
+    output_lag_cols = [f'{settings.output_var}_Lag_{lag}' for lag in range(1, settings.num_lags + 1)]
+    feature_cols_new.extend(output_lag_cols)
+
+    # Build all lag columns from one sliding-window view; output lags are 0 without an output column
+    has_output = settings.output_var in new_df.columns
+    lag_vars = list(dict.fromkeys(
+        [var for var in selected_inputs if var_types[var] == "Dynamic"] + ([settings.output_var] if has_output else [])
+    ))
+    lags = lag_features(new_df, lag_vars, settings.num_lags)
+    if not has_output:
+        lags[output_lag_cols] = 0.0
+    new_df = pd.concat([new_df.drop(columns=lags.columns, errors='ignore'), lags], axis=1)
+
+    # Handle missing values
+    new_df.dropna(subset=[col for col in feature_cols_new if "_Lag_" in col], how='all', inplace=True)
+
+    # Create the feature set; the target column is never needed for inference
+    present_cols = [col for col in settings.feature_cols if col in feature_cols_new and col in new_df.columns]
+    full_new_df = new_df[present_cols].reindex(columns=settings.feature_cols)
+    full_new_df.fillna(0, inplace=True)
+    # Parse only object columns, then cast the whole block to float32 in one pass
+    object_cols = full_new_df.select_dtypes(include='object').columns
+    if len(object_cols):
+        full_new_df[object_cols] = full_new_df[object_cols].apply(pd.to_numeric, errors='coerce')
+
+    # Scale data
+    X_new = scale_features(full_new_df.to_numpy(dtype=np.float32, copy=True), settings.scaler)
+    X_new = to_sequences(X_new, settings.layout)
+
+    # Generate predictions with uncertainty
+    y_new_pred_mean, y_new_pred_std, samples_drawn = predict_with_uncertainty(
+        inference_model,
+        X_new,
+        settings.num_samples,
+        jit_compile=settings.jit_compile,
+        return_count=True
+    )
+
+    # Inverse transform predictions with the stored target scalars
+    y_new_pred = inverse_scale_target(y_new_pred_mean, settings.y_min, settings.y_range)
+    y_new_pred = np.clip(y_new_pred, 0, None)
+    y_new_pred_std = y_new_pred_std * settings.y_range
+    return new_df, y_new_pred, y_new_pred_std, samples_drawn
+
+def new_prediction_figure(predictions_df, file_name):
+    """Plotly figure of actual vs. predicted discharge with a 95% band for one new-data file."""
+    # WebGL traces over float32 arrays keep long series light in the browser
+    dates = plot_axis(predictions_df["Date"])
+    y_new_pred = predictions_df["Predicted_Discharge"].to_numpy(dtype=np.float32)
+    y_new_pred_std = predictions_df["Uncertainty"].to_numpy(dtype=np.float32)
+
+    # Create enhanced plot
+    go = lazy_import('plotly.graph_objects')
+    fig = go.Figure()
+
+    # Plot actual discharge if available
+    if predictions_df["Actual_Discharge"].notna().any():
+        fig.add_trace(go.Scattergl(
+            x=dates,
+            y=predictions_df["Actual_Discharge"].to_numpy(dtype=np.float32, na_value=np.nan),
+            name="Actual Discharge",
+            line=dict(color='blue', width=2),
+            hovertemplate='<b>Date</b>: %{x}<br><b>Actual Discharge</b>: %{y:.2f} m³/s<br>'
+        ))
+
+    # Plot predicted discharge
+    fig.add_trace(go.Scattergl(
+        x=dates,
+        y=y_new_pred,
+        name="Predicted Discharge",
+        line=dict(color='red', width=2),
+        hovertemplate='<b>Date</b>: %{x}<br><b>Predicted Discharge</b>: %{y:.2f} m³/s<br>'
+    ))
+
+    # Add confidence interval
+    band_x, band_y = confidence_band(dates, y_new_pred, y_new_pred_std)
+    fig.add_trace(go.Scattergl(
+        x=band_x,
+        y=band_y,
+        fill='toself',
+        fillcolor='rgba(255,0,0,0.2)',
+        line=dict(color='rgba(255,0,0,0)'),
+        name='95% Confidence Interval',
+        showlegend=True
+    ))
+
+    # Update layout
+    fig.update_layout(
+        title=dict(
+            text=f"Discharge Analysis - {file_name}",
+            font=dict(size=24)
+        ),
+        xaxis=dict(
+            title="Date",
+            showgrid=True,
+            gridcolor='rgba(211, 211, 211, 0.4)',
+            showline=True
+        ),
+        yaxis=dict(
+            title="Discharge (m³/s)",
+            showgrid=True,
+            gridcolor='rgba(211, 211, 211, 0.4)',
+            showline=True,
+            rangemode='nonnegative'
+        ),
+        plot_bgcolor='white',
+        height=700,
+        hovermode='x unified'
+    )
+    return fig
+
+@st.cache_data(hash_funcs={pd.DataFrame: hash_frame}, show_spinner=False)
+def new_prediction_png(predictions_df, file_name, width=1920, height=1080):
+    """Export the new-data prediction plot as PNG bytes once per unchanged result."""
+    try:
+        img_bytes = BytesIO()
+        new_prediction_figure(predictions_df, file_name).write_image(
+            img_bytes, format='png', width=width, height=height, scale=2
+        )
+        return img_bytes.getvalue()
+    except Exception:
+        # Silently switch to matplotlib, sized to render 1920x1080 without a dpi=300 pass
+        dates = predictions_df["Date"]
+        y_new_pred = predictions_df["Predicted_Discharge"].to_numpy()
+        y_new_pred_std = predictions_df["Uncertainty"].to_numpy()
+        fig = lazy_import('matplotlib.figure').Figure(figsize=(16, 9), dpi=width / 16)
+        ax = fig.subplots()
+        if predictions_df["Actual_Discharge"].notna().any():
+            ax.plot(dates, predictions_df["Actual_Discharge"], 'b-', linewidth=2, label='Actual')
+        ax.plot(dates, y_new_pred, 'r-', linewidth=2, label='Predicted')
+        ax.fill_between(dates,
+                        y_new_pred - 1.96 * y_new_pred_std,
+                        y_new_pred + 1.96 * y_new_pred_std,
+                        color='red', alpha=0.2, label='95% CI')
+        ax.set_title(f"Discharge Analysis - {file_name}")
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Discharge (m³/s)")
+        ax.grid(True, alpha=0.3)
+        ax.legend()
+        ax.tick_params(axis='x', labelrotation=45)
+        fig.tight_layout()
+        return agg_png_bytes(fig)
+
+def render_new_prediction(file_name, new_df, date_col, output_var, y_new_pred, y_new_pred_std, samples_drawn):
+    """Plot, tabulate and offer downloads for one new-data prediction."""
+    # Create predictions DataFrame with proper date handling
+    dates = new_df[date_col] if date_col != "None" else pd.RangeIndex(len(new_df))
+    predictions_df = pd.DataFrame({
+        "Date": dates,
+        "Actual_Discharge": new_df[output_var] if output_var in new_df.columns else None,
+        "Predicted_Discharge": y_new_pred,
+        "Uncertainty": y_new_pred_std
+    })
+
+    # Display the plot
+    st.plotly_chart(new_prediction_figure(predictions_df, file_name), use_container_width=True)
+    st.caption(f"Uncertainty estimated from {samples_drawn} Monte Carlo samples")
+
+    # Create download buttons
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Plot download, exported once per unchanged result
+        st.download_button(
+            "⬇️ Download Plot (PNG)",
+            new_prediction_png(predictions_df, file_name),
+            f"discharge_analysis_{file_name}.png",
+            mime="image/png"
+        )
+
+    with col2:
+        # Data download
+        csv = csv_bytes(predictions_df)
+        st.download_button(
+            "⬇️ Download Predictions (CSV)",
+            csv,
+            f"discharge_predictions_{file_name}.csv",
+            "text/csv"
+        )
+
+    # Display predictions table
+    st.markdown("### Prediction Results")
+    st.dataframe(predictions_df, use_container_width=True)
+
+    st.success(f"Analysis completed successfully for {file_name}!")
+
+def run_new_predictions(tasks, model_type):
+    """Predict several new-data files concurrently on a shared model, then render them in order."""
+    settings = SimpleNamespace(
+        feature_cols=st.session_state.feature_cols,
+        output_var=st.session_state.output_var,
+        num_lags=st.session_state.num_lags,
+        scaler=st.session_state.scaler,
+        y_min=st.session_state.y_min,
+        y_range=st.session_state.y_range,
+        num_samples=st.session_state.num_samples,
+        jit_compile=st.session_state.use_xla,
+        layout=input_layout(st.session_state.feature_cols)
+    )
+    input_shape = (1, len(settings.feature_cols)) if settings.layout is None else settings.layout.shape
+    inference_model = load_inference_model(input_shape, model_type)
+    with ThreadPoolExecutor(max_workers=min(NEW_DATA_MAX_WORKERS, len(tasks))) as executor:
+        results = list(executor.map(
+            lambda task: predict_new_file(task.new_df, task.selected_inputs, task.var_types, inference_model, settings),
+            tasks
+        ))
+    for task, (new_df, y_new_pred, y_new_pred_std, samples_drawn) in zip(tasks, results):
+        render_new_prediction(task.file_name, new_df, task.date_col, settings.output_var,
+                              y_new_pred, y_new_pred_std, samples_drawn)
 
 # -------------------- Styling and Streamlit UI --------------------
 st.set_page_config(page_title="Wateran", page_icon="🌊", layout="wide")
@@ -665,66 +1804,9 @@ with st.sidebar:
 st.title("🌊 Wateran: Advanced Time Series Prediction")
 st.markdown("**State-of-the-art Time Series Prediction with Uncertainty Quantification**", unsafe_allow_html=True)
 
-# Initialize session state variables
-if 'model_type' not in st.session_state:
-    st.session_state.model_type = "GRU"
-if 'num_lags' not in st.session_state:
-    st.session_state.num_lags = DEFAULT_NUM_LAGS
-if 'input_vars' not in st.session_state:
-    st.session_state.input_vars = []
-if 'output_var' not in st.session_state:
-    st.session_state.output_var = None
-if 'var_types' not in st.session_state:
-    st.session_state.var_types = {}
-if 'date_col' not in st.session_state:
-    st.session_state.date_col = None
-if 'df' not in st.session_state:
-    st.session_state.df = None
-if 'feature_cols' not in st.session_state:
-    st.session_state.feature_cols = []
-if 'handle_missing' not in st.session_state:
-    st.session_state.handle_missing = 'median'
-if 'remove_outliers' not in st.session_state:
-    st.session_state.remove_outliers = True
-if 'outlier_threshold' not in st.session_state:
-    st.session_state.outlier_threshold = 3.0
-if 'enable_feature_engineering' not in st.session_state:
-    st.session_state.enable_feature_engineering = True
-if 'physics_weight' not in st.session_state:
-    st.session_state.physics_weight = DEFAULT_PHYSICS_WEIGHT
-if 'use_mass_conservation' not in st.session_state:
-    st.session_state.use_mass_conservation = True
-if 'use_smoothness' not in st.session_state:
-    st.session_state.use_smoothness = True
-
-# Initialize other session state variables
-for key in ['metrics', 'train_results_df', 'test_results_df', 'fig', 'model_plot', 'scaler', 
-            'new_predictions_df', 'new_fig', 'gru_layers', 'lstm_layers', 'rnn_layers', 'gru_units', 
-            'lstm_units', 'rnn_units', 'dense_layers', 'dense_units', 'learning_rate', 
-            'new_data_file', 'selected_inputs', 'new_date_col', 'selected_metrics', 'new_var_types', 
-            'cv_metrics', 'X_train', 'y_train', 'X_test', 'y_test', 'model', 'hybrid_models',
-            'use_attention', 'use_bidirectional', 'use_residual', 'dropout_rate', 'prediction_horizon', 'num_samples']:
-    if key not in st.session_state:
-        if key in ['gru_layers', 'lstm_layers', 'rnn_layers', 'dense_layers']:
-            st.session_state[key] = 1
-        elif key == 'gru_units':
-            st.session_state[key] = [DEFAULT_GRU_UNITS]
-        elif key == 'lstm_units':
-            st.session_state[key] = [DEFAULT_LSTM_UNITS]
-        elif key == 'rnn_units':
-            st.session_state[key] = [DEFAULT_RNN_UNITS]
-        elif key == 'dense_units':
-            st.session_state[key] = [DEFAULT_DENSE_UNITS]
-        elif key == 'learning_rate':
-            st.session_state[key] = DEFAULT_LEARNING_RATE
-        elif key == 'hybrid_models':
-            st.session_state[key] = ["GRU"]
-        elif key == 'prediction_horizon':
-            st.session_state[key] = DEFAULT_PREDICTION_HORIZON
-        elif key == 'num_samples':
-            st.session_state[key] = 100
-        else:
-            st.session_state[key] = None
+# Initialize session state variables (lists are copied so sessions never share them)
+for key, value in _DEFAULTS.items():
+    st.session_state.setdefault(key, copy.copy(value))
 
 # Sidebar for Navigation and Help
 with st.sidebar:
@@ -744,6 +1826,37 @@ with st.sidebar:
         - **Advanced Features**: Attention, Bidirectional layers, Residual connections.
         - **Uncertainty**: Probabilistic predictions with confidence intervals.
         """)
+    with st.expander("⚡ Performance"):
+        st.session_state.use_tensorrt = st.checkbox(
+            "Use TensorRT Inference (GPU)",
+            value=st.session_state.use_tensorrt,
+            help="Convert the trained model to an FP16 TensorRT engine for predictions"
+        )
+        st.session_state.use_tflite = st.checkbox(
+            "Use INT8 TFLite Inference (CPU)",
+            value=st.session_state.use_tflite,
+            help="Quantize the trained model's weights to INT8 for predictions; only applied on CPUs with VNNI/dot-product support"
+        )
+        st.session_state.use_mixed_precision = st.checkbox(
+            "Mixed Precision (BF16/FP16)",
+            value=st.session_state.use_mixed_precision,
+            help="Train with bfloat16 compute on TPUs and Ampere or newer GPUs, float16 on older GPUs; no effect on CPU-only hosts"
+        )
+        st.session_state.use_xla = st.checkbox(
+            "XLA Compilation",
+            value=st.session_state.use_xla,
+            help="Fuse training and inference ops with XLA (jit_compile) for this session's models; disable if a layer is unsupported"
+        )
+        st.session_state.log_histograms = st.checkbox(
+            "Debug: TensorBoard Histograms",
+            value=st.session_state.log_histograms,
+            help="Write per-epoch weight histograms to TensorBoard (slows training)"
+        )
+        # Only a live Keras model can be exported
+        if st.button("📦 Export SavedModel", disabled=not hasattr(st.session_state.model, 'get_weights'),
+                     help="Write the trained model with its serving and Monte Carlo signatures for serving or cold starts"):
+            export_serving_model(st.session_state.model, MODEL_SAVED_DIR)
+            st.success(f"SavedModel exported to {MODEL_SAVED_DIR}")
 
 # Main Layout
 col1, col2 = st.columns([2, 1], gap="large")
@@ -755,17 +1868,8 @@ with col1:
                                     help="Upload your time series data file (Excel, CSV, or JSON).")
     
     if uploaded_file:
-        @st.cache_data
-        def load_data(file):
-            if file.name.endswith('.csv'):
-                return pd.read_csv(file)
-            elif file.name.endswith('.json'):
-                return pd.read_json(file)
-            else:
-                return pd.read_excel(file)
-        
-        df = load_data(uploaded_file)
-        st.session_state.df = df
+        raw_bytes = uploaded_file.getvalue()
+        df = load_data(raw_bytes, uploaded_file.name)
         st.markdown("**Dataset Preview:**")
         st.dataframe(df.head(5), use_container_width=True)
         
@@ -794,17 +1898,17 @@ with col1:
         
         # Feature engineering options
         with st.expander("🔧 Feature Engineering", expanded=True):
-            engineer_features = st.checkbox("Enable Feature Engineering", value=st.session_state.enable_feature_engineering)
-            st.session_state.enable_feature_engineering = engineer_features
+            # Distinct name so the checkbox does not shadow the engineer_features() function
+            enable_feature_engineering = st.checkbox("Enable Feature Engineering", value=st.session_state.enable_feature_engineering)
+            st.session_state.enable_feature_engineering = enable_feature_engineering
         
         datetime_cols = [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col]) or "date" in col.lower()]
         date_col = st.selectbox("Select Date Column (optional)", ["None"] + datetime_cols, index=0, key="date_col_train")
         st.session_state.date_col = date_col if date_col != "None" else None
-        if date_col != "None":
-            df[date_col] = pd.to_datetime(df[date_col])
-            df = df.sort_values(date_col)
+        df = prepare_df(raw_bytes, uploaded_file.name, st.session_state.date_col)
+        st.session_state.df = df
         
-        numeric_cols = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col]) and col != st.session_state.date_col]
+        numeric_cols = df.select_dtypes(include=['number', 'bool']).columns.drop(st.session_state.date_col, errors='ignore').tolist()
         if len(numeric_cols) < 2:
             st.error("Dataset requires at least two numeric columns.")
             st.stop()
@@ -819,33 +1923,25 @@ with col1:
             st.stop()
 
         with st.expander("Variable Types", expanded=True):
-            var_types = {}
-            for var in input_vars:
-                var_types[var] = st.selectbox(f"{var} Type", ["Dynamic", "Static"], key=f"{var}_type")
-            st.session_state.var_types = var_types
+            st.session_state.var_types = var_types_editor(input_vars, st.session_state.var_types, "var_types")
         
         with st.expander("📋 Data Exploration"):
+            summary_df, missing_df = exploration_tables(df, tuple(numeric_cols))
             st.markdown("**Summary Statistics**")
-            st.dataframe(df[numeric_cols].describe(), use_container_width=True)
+            st.dataframe(summary_df, use_container_width=True)
             
             st.markdown("**Time Series Plot**")
+            plt = lazy_import('matplotlib.pyplot')
             fig, ax = plt.subplots()
             df[numeric_cols].plot(ax=ax)
             ax.set_title("Time Series Plot")
             st.pyplot(fig)
+            plt.close(fig)
             
             st.markdown("**Correlation Heatmap**")
-            fig, ax = plt.subplots()
-            sns.heatmap(df[numeric_cols].corr(), annot=True, cmap="coolwarm", ax=ax)
-            ax.set_title("Correlation Matrix")
-            st.pyplot(fig)
+            st.image(corr_heatmap_png(df, tuple(numeric_cols)))
             
             st.markdown("**Missing Values Analysis**")
-            missing_df = pd.DataFrame({
-                'Column': df.columns,
-                'Missing Values': df.isnull().sum(),
-                'Missing %': (df.isnull().sum() / len(df) * 100).round(2)
-            })
             st.dataframe(missing_df, use_container_width=True)
 
         st.session_state.input_vars = input_vars
@@ -871,6 +1967,11 @@ with col2:
         use_attention = st.checkbox("Use Attention Mechanism", value=st.session_state.use_attention)
         use_bidirectional = st.checkbox("Use Bidirectional Layers", value=st.session_state.use_bidirectional)
         use_residual = st.checkbox("Use Residual Connections", value=st.session_state.use_residual)
+        st.session_state.sequence_input = st.checkbox(
+            "Use Lags as Timesteps",
+            value=st.session_state.sequence_input,
+            help="Feed GRU/LSTM/RNN models one timestep per lag instead of a single flattened step"
+        )
         dropout_rate = st.slider("Dropout Rate", 0.0, 0.5, 0.2, step=0.05)
         
         st.session_state.use_attention = use_attention
@@ -920,75 +2021,21 @@ with col2:
             if not hybrid_models:
                 st.warning("Please select at least one hybrid model. Defaulting to GRU.")
                 st.session_state.hybrid_models = ["GRU"]
-            hybrid_layers = st.number_input("Total Hybrid Layers", min_value=1, max_value=10, value=max(st.session_state.gru_layers, 1), 
-                                           step=1, key="hybrid_layers")
-            st.session_state.gru_layers = hybrid_layers
-            st.session_state.gru_units = [
-                st.number_input(
-                    f"Hybrid Layer {i+1} Units",
-                    min_value=8,
-                    max_value=512,
-                    value=st.session_state.gru_units[i] if i < len(st.session_state.gru_units) else DEFAULT_GRU_UNITS,
-                    step=8,
-                    key=f"hybrid_{i}"
-                ) for i in range(hybrid_layers)
-            ]
+            st.session_state.gru_units = layer_sizes_input("Hybrid Layer Units (comma-separated)", st.session_state.gru_units,
+                                                           "hybrid_units", max_layers=10)
+            st.session_state.gru_layers = len(st.session_state.gru_units)
         elif model_type == "GRU":
-            gru_layers = st.number_input("GRU Layers", min_value=1, max_value=5, value=st.session_state.gru_layers, step=1, key="gru_layers")
-            if gru_layers != st.session_state.gru_layers:
-                st.session_state.gru_layers = gru_layers
-            st.session_state.gru_units = [
-                st.number_input(
-                    f"GRU Layer {i+1} Units",
-                    min_value=8,
-                    max_value=512,
-                    value=st.session_state.gru_units[i] if i < len(st.session_state.gru_units) else DEFAULT_GRU_UNITS,
-                    step=8,
-                    key=f"gru_{i}"
-                ) for i in range(st.session_state.gru_layers)
-            ]
+            st.session_state.gru_units = layer_sizes_input("GRU Layer Units (comma-separated)", st.session_state.gru_units, "gru_units_text")
+            st.session_state.gru_layers = len(st.session_state.gru_units)
         elif model_type == "LSTM":
-            lstm_layers = st.number_input("LSTM Layers", min_value=1, max_value=5, value=st.session_state.lstm_layers, step=1, key="lstm_layers")
-            if lstm_layers != st.session_state.lstm_layers:
-                st.session_state.lstm_layers = lstm_layers
-            st.session_state.lstm_units = [
-                st.number_input(
-                    f"LSTM Layer {i+1} Units",
-                    min_value=8,
-                    max_value=512,
-                    value=st.session_state.lstm_units[i] if i < len(st.session_state.lstm_units) else DEFAULT_LSTM_UNITS,
-                    step=8,
-                    key=f"lstm_{i}"
-                ) for i in range(st.session_state.lstm_layers)
-            ]
+            st.session_state.lstm_units = layer_sizes_input("LSTM Layer Units (comma-separated)", st.session_state.lstm_units, "lstm_units_text")
+            st.session_state.lstm_layers = len(st.session_state.lstm_units)
         elif model_type == "RNN":
-            rnn_layers = st.number_input("RNN Layers", min_value=1, max_value=5, value=st.session_state.rnn_layers, step=1, key="rnn_layers")
-            if rnn_layers != st.session_state.rnn_layers:
-                st.session_state.rnn_layers = rnn_layers
-            st.session_state.rnn_units = [
-                st.number_input(
-                    f"RNN Layer {i+1} Units",
-                    min_value=8,
-                    max_value=512,
-                    value=st.session_state.rnn_units[i] if i < len(st.session_state.rnn_units) else DEFAULT_RNN_UNITS,
-                    step=8,
-                    key=f"rnn_{i}"
-                ) for i in range(st.session_state.rnn_layers)
-            ]
+            st.session_state.rnn_units = layer_sizes_input("RNN Layer Units (comma-separated)", st.session_state.rnn_units, "rnn_units_text")
+            st.session_state.rnn_layers = len(st.session_state.rnn_units)
         
-        dense_layers = st.number_input("Dense Layers", min_value=1, max_value=5, value=st.session_state.dense_layers, step=1, key="dense_layers")
-        if dense_layers != st.session_state.dense_layers:
-            st.session_state.dense_layers = dense_layers
-        st.session_state.dense_units = [
-            st.number_input(
-                f"Dense Layer {i+1} Units",
-                min_value=8,
-                max_value=512,
-                value=st.session_state.dense_units[i] if i < len(st.session_state.dense_units) else DEFAULT_DENSE_UNITS,
-                step=8,
-                key=f"dense_{i}"
-            ) for i in range(st.session_state.dense_layers)
-        ]
+        st.session_state.dense_units = layer_sizes_input("Dense Layer Units (comma-separated)", st.session_state.dense_units, "dense_units_text")
+        st.session_state.dense_layers = len(st.session_state.dense_units)
         learning_rate = st.number_input("Learning Rate", min_value=0.00001, max_value=0.1, value=st.session_state.learning_rate, 
                                         format="%.5f", key="learning_rate")
         if learning_rate != st.session_state.learning_rate:
@@ -1002,10 +2049,12 @@ with col2:
         col_btn1, col_btn2, col_btn3 = st.columns(3)
         with col_btn1:
             if st.button("🚀 Train Model", key="train_button"):
-                df = st.session_state.df.copy()
+                configure_tensorflow(st.session_state.use_mixed_precision)
+                df = st.session_state.df
+                data_key = preparation_key(df)
                 
                 # Preprocess data
-                processed_df, feature_cols = preprocess_data(
+                processed_df, feature_cols = prepare_features(
                     df, 
                     st.session_state.input_vars, 
                     st.session_state.output_var, 
@@ -1014,41 +2063,22 @@ with col2:
                     st.session_state.date_col,
                     st.session_state.handle_missing,
                     st.session_state.remove_outliers,
-                    st.session_state.outlier_threshold
+                    st.session_state.outlier_threshold,
+                    st.session_state.enable_feature_engineering
                 )
                 
-                # Feature engineering
-                if st.session_state.enable_feature_engineering:
-                    try:
-                        processed_df = engineer_features(
-                            processed_df,
-                            feature_cols,
-                            st.session_state.output_var,
-                            st.session_state.date_col
-                        )
-                    except Exception:
-                        # Silently continue with basic features
-                        pass
-                
                 st.session_state.feature_cols = feature_cols
                 
-                # Split data
-                train_size = int(len(processed_df) * train_split)
-                train_df, test_df = processed_df[:train_size], processed_df[train_size:]
-                
-                # Scale data
-                scaler = MinMaxScaler()
-                train_scaled = scaler.fit_transform(train_df[feature_cols + [st.session_state.output_var]])
-                test_scaled = scaler.transform(test_df[feature_cols + [st.session_state.output_var]])
+                # Split, scale and prepare sequences as contiguous float32 buffers for the input pipeline
+                model_cols = feature_cols + [st.session_state.output_var]
+                scaler, X_train, y_train, X_test, y_test = split_and_scale(
+                    processed_df, model_cols, train_split, layout=input_layout(feature_cols)
+                )
                 st.session_state.scaler = scaler
-                
-                # Prepare sequences
-                X_train, y_train = train_scaled[:, :-1], train_scaled[:, -1]
-                X_test, y_test = test_scaled[:, :-1], test_scaled[:, -1]
-                X_train = X_train.reshape((X_train.shape[0], 1, X_train.shape[1]))
-                X_test = X_test.reshape((X_test.shape[0], 1, X_test.shape[1]))
-                y_train = y_train.reshape(-1, 1)
-                y_test = y_test.reshape(-1, 1)
+                st.session_state.y_min, st.session_state.y_range = scaler.data_min[-1], scaler.data_range[-1]
+                # Reused by Test and CV while the data and preprocessing settings are unchanged
+                st.session_state.cached_Xy = (data_key, train_split, processed_df, feature_cols,
+                                              X_train, y_train, X_test, y_test)
                 
                 # Validation split
                 val_size = int(len(X_train) * 0.2)
@@ -1061,68 +2091,92 @@ with col2:
                 st.session_state.X_test, st.session_state.y_test = X_test, y_test
                 
                 # Build model
-                layers = (st.session_state.gru_layers if model_type in ["GRU", "Hybrid"] else 
-                          st.session_state.lstm_layers if model_type == "LSTM" else 
-                          st.session_state.rnn_layers if model_type == "RNN" else 
-                          st.session_state.gru_layers)
-                units = (st.session_state.gru_units if model_type in ["GRU", "Hybrid"] else 
-                         st.session_state.lstm_units if model_type == "LSTM" else 
-                         st.session_state.rnn_units if model_type == "RNN" else 
-                         st.session_state.gru_units)
+                layers = st.session_state[LAYERS_MAP[model_type]]
+                units = st.session_state[UNITS_MAP[model_type]]
                 
-                st.session_state.model = build_advanced_model(
+                st.session_state.model = get_training_model((
                     (X_train.shape[1], X_train.shape[2]), 
                     model_type, 
                     layers, 
-                    units, 
+                    tuple(units), 
                     st.session_state.dense_layers, 
-                    st.session_state.dense_units, 
+                    tuple(st.session_state.dense_units), 
                     st.session_state.learning_rate,
                     st.session_state.use_attention,
                     st.session_state.use_bidirectional,
                     st.session_state.use_residual,
-                    st.session_state.dropout_rate
-                )
+                    st.session_state.dropout_rate,
+                    st.session_state.use_xla
+                ))
+                st.session_state.model_sig = model_signature((X_train.shape[1], X_train.shape[2]), model_type)
                 
                 # Callbacks
-                early_stopping = EarlyStopping(
+                k = keras_api()
+                early_stopping = k.EarlyStopping(
                     monitor='val_loss',
                     patience=10,
                     restore_best_weights=True
                 )
-                lr_scheduler = ReduceLROnPlateau(
+                lr_scheduler = k.ReduceLROnPlateau(
                     monitor='val_loss',
                     factor=0.5,
                     patience=5,
                     min_lr=1e-6
                 )
-                model_checkpoint = ModelCheckpoint(
+                model_checkpoint = k.ModelCheckpoint(
                     MODEL_WEIGHTS_PATH,
                     monitor='val_loss',
                     save_best_only=True,
                     mode='min'
                 )
-                tensorboard = TensorBoard(
+                tensorboard = k.TensorBoard(
                     log_dir=TENSORBOARD_DIR,
-                    histogram_freq=1
+                    histogram_freq=1 if st.session_state.log_histograms else 0,
+                    write_graph=False,
+                    profile_batch=0
                 )
                 
                 with st.spinner("Training in progress..."):
                     progress_placeholder = st.empty()
-                    metrics_placeholder = st.empty()
-                    callback = StreamlitProgressCallback(epochs, progress_placeholder, metrics_placeholder)
+                    callback = k.StreamlitProgressCallback(epochs, progress_placeholder)
                     
                     try:
+                        # NumPy has no bfloat16, so only the float16 policy gets half-width inputs
+                        policy = lazy_import('tensorflow').keras.mixed_precision.global_policy().name
+                        fit_dtype = np.float16 if policy == 'mixed_float16' else np.float32
                         history = train_advanced_model(
                             st.session_state.model,
-                            X_train, y_train,
-                            X_val, y_val,
+                            X_train.astype(fit_dtype, copy=False), y_train,
+                            X_val.astype(fit_dtype, copy=False), y_val,
                             epochs, batch_size,
                             [callback, early_stopping, lr_scheduler, model_checkpoint, tensorboard]
                         )
                         
                         st.session_state.model.save_weights(MODEL_WEIGHTS_PATH)
+                        cached_trained_model.clear()
                         st.session_state.model.save(MODEL_FULL_PATH)
+                        cached_full_model.clear()
+                        # The SavedModel is exported on demand; drop the previous run's stale export
+                        shutil.rmtree(MODEL_SAVED_DIR, ignore_errors=True)
+                        
+                        # Optional TensorRT engine for the inference paths (converted from a fresh export)
+                        st.session_state.trt_model = None
+                        if st.session_state.use_tensorrt and tensorrt_available():
+                            try:
+                                export_serving_model(st.session_state.model, MODEL_SAVED_DIR)
+                                st.session_state.trt_model = convert_to_tensorrt(
+                                    MODEL_SAVED_DIR, MODEL_TRT_DIR, X_train[:batch_size]
+                                )
+                            except Exception as e:
+                                st.warning(f"TensorRT conversion failed, using Keras inference: {str(e)}")
+                        
+                        # Optional INT8 TFLite model for CPU inference
+                        st.session_state.tflite_model = None
+                        if st.session_state.use_tflite and int8_cpu_available():
+                            try:
+                                st.session_state.tflite_model = convert_to_tflite(st.session_state.model, MODEL_TFLITE_PATH)
+                            except Exception as e:
+                                st.warning(f"TFLite conversion failed, using Keras inference: {str(e)}")
                         
                         # Plot training history
                         fig = plot_advanced_metrics(callback.metrics_history)
@@ -1140,7 +2194,12 @@ with col2:
                     with st.spinner("Optimizing hyperparameters... This may take a few minutes."):
                         try:
                             # Clear any existing TensorFlow session state
+                            tf = lazy_import('tensorflow')
+                            optuna = lazy_import('optuna')
+                            configure_tensorflow(st.session_state.use_mixed_precision)
                             tf.keras.backend.clear_session()
+                            _OPTUNA_MODEL_CACHE.clear()
+                            st.session_state.train_model_cache.clear()
                             
                             # Create validation split
                             val_size = int(len(st.session_state.X_train) * 0.2)
@@ -1161,34 +2220,44 @@ with col2:
                             X_train_opt = X_train_subset[:-val_size]
                             y_train_opt = y_train_subset[:-val_size]
                             
-                            # Ensure data has correct shape
-                            if len(X_train_opt.shape) == 2:
-                                X_train_opt = X_train_opt.reshape((X_train_opt.shape[0], 1, X_train_opt.shape[1]))
-                            if len(y_train_opt.shape) == 1:
-                                y_train_opt = y_train_opt.reshape(-1, 1)
-                            if len(X_val.shape) == 2:
-                                X_val = X_val.reshape((X_val.shape[0], 1, X_val.shape[1]))
-                            if len(y_val.shape) == 1:
-                                y_val = y_val.reshape(-1, 1)
-                            
-                            # Create study with faster sampler
+                            # Persist the study so reruns resume with warm TPE priors
+                            study_key = hashlib.md5(
+                                X_train_opt.tobytes() + y_train_opt.tobytes() + st.session_state.model_type.encode()
+                            ).hexdigest()
                             study = optuna.create_study(
+                                study_name=f"wateran_{study_key}",
+                                storage=optuna.storages.RDBStorage(
+                                    OPTUNA_STORAGE, engine_kwargs={'connect_args': {'timeout': OPTUNA_DB_TIMEOUT}}
+                                ),
+                                load_if_exists=True,
                                 direction='minimize',
-                                sampler=optuna.samplers.TPESampler(n_startup_trials=5)
+                                sampler=optuna.samplers.TPESampler(n_startup_trials=5, multivariate=True, group=True),
+                                pruner=optuna.pruners.MedianPruner(n_startup_trials=2, n_warmup_steps=2)
                             )
                             
-                            # Run optimization with progress bar
+                            # The round's total is stored in the study, so concurrent sessions optimizing the
+                            # same data stop at one shared total; a new round starts once it is reached
+                            budget = study.user_attrs.get('trial_budget', 0)
+                            if len(study.trials) >= budget:
+                                budget = len(study.trials) + OPTUNA_N_TRIALS
+                                study.set_user_attr('trial_budget', budget)
+                            trial_budget = optuna.study.MaxTrialsCallback(budget, states=None)
                             progress_bar = st.progress(0)
-                            for i in range(8):
-                                study.optimize(lambda trial: objective(
-                                    trial, 
-                                    X_train_opt, 
-                                    y_train_opt, 
-                                    X_val, 
-                                    y_val, 
-                                    st.session_state.model_type
-                                ), n_trials=1)
-                                progress_bar.progress((i + 1) / 8)
+                            # Bind session values up front so the objective never reads session state mid-study
+                            study.optimize(
+                                functools.partial(
+                                    objective,
+                                    X_train=X_train_opt,
+                                    y_train=y_train_opt,
+                                    X_val=X_val,
+                                    y_val=y_val,
+                                    model_type=st.session_state.model_type,
+                                    jit_compile=st.session_state.use_xla
+                                ),
+                                n_trials=OPTUNA_N_TRIALS,
+                                n_jobs=OPTUNA_N_JOBS,
+                                callbacks=[trial_budget, make_progress_callback(progress_bar, OPTUNA_N_TRIALS)]
+                            )
                             
                             # Store best parameters in session state without modifying widget values
                             best_params = study.best_params
@@ -1221,6 +2290,7 @@ with col2:
                             """)
                             
                             # Final cleanup
+                            _OPTUNA_MODEL_CACHE.clear()
                             tf.keras.backend.clear_session()
                             
                         except Exception as e:
@@ -1233,131 +2303,77 @@ with col2:
                     st.error("Train the model first!")
                     st.stop()
                 
-                # Preprocess test data
-                df = st.session_state.df.copy()
-                processed_df, feature_cols = preprocess_data(
-                    df, 
-                    st.session_state.input_vars, 
-                    st.session_state.output_var, 
-                    st.session_state.var_types, 
-                    st.session_state.num_lags,
-                    st.session_state.date_col,
-                    st.session_state.handle_missing,
-                    st.session_state.remove_outliers,
-                    st.session_state.outlier_threshold
-                )
-                
-                # Feature engineering
-                if st.session_state.enable_feature_engineering:
-                    try:
-                        processed_df = engineer_features(
-                            processed_df,
-                            feature_cols,
-                            st.session_state.output_var,
-                            st.session_state.date_col
-                        )
-                    except Exception:
-                        # Silently continue with basic features
-                        pass
-                
-                st.session_state.feature_cols = feature_cols
-                
-                # Split and scale data
-                train_size = int(len(processed_df) * train_split)
-                train_df, test_df = processed_df[:train_size], processed_df[train_size:]
-                scaler = st.session_state.scaler
-                
-                train_scaled = scaler.transform(train_df[feature_cols + [st.session_state.output_var]])
-                test_scaled = scaler.transform(test_df[feature_cols + [st.session_state.output_var]])
+                # Preprocess test data, reusing the training arrays when nothing has changed
+                df = st.session_state.df
+                cached = st.session_state.cached_Xy
+                if cached is not None and cached[:2] == (preparation_key(df), train_split):
+                    processed_df, feature_cols, X_train, y_train, X_test, y_test = cached[2:]
+                    train_size = int(len(processed_df) * train_split)
+                else:
+                    processed_df, feature_cols = prepare_features(
+                        df, 
+                        st.session_state.input_vars, 
+                        st.session_state.output_var, 
+                        st.session_state.var_types, 
+                        st.session_state.num_lags,
+                        st.session_state.date_col,
+                        st.session_state.handle_missing,
+                        st.session_state.remove_outliers,
+                        st.session_state.outlier_threshold,
+                        st.session_state.enable_feature_engineering
+                    )
                 
-                X_train, y_train = train_scaled[:, :-1], train_scaled[:, -1]
-                X_test, y_test = test_scaled[:, :-1], test_scaled[:, -1]
-                X_train = X_train.reshape((X_train.shape[0], 1, X_train.shape[1]))
-                X_test = X_test.reshape((X_test.shape[0], 1, X_test.shape[1]))
-                y_train = y_train.reshape(-1, 1)
-                y_test = y_test.reshape(-1, 1)
+                    st.session_state.feature_cols = feature_cols
                 
-                # Use existing model if available, otherwise load weights
-                if st.session_state.model is None:
-                    layers = (st.session_state.gru_layers if model_type in ["GRU", "Hybrid"] else 
-                              st.session_state.lstm_layers if model_type == "LSTM" else 
-                              st.session_state.rnn_layers if model_type == "RNN" else 
-                              st.session_state.gru_layers)
-                    units = (st.session_state.gru_units if model_type in ["GRU", "Hybrid"] else 
-                             st.session_state.lstm_units if model_type == "LSTM" else 
-                             st.session_state.rnn_units if model_type == "RNN" else 
-                             st.session_state.gru_units)
-                    
-                    st.session_state.model = build_advanced_model(
-                        (X_train.shape[1], X_train.shape[2]), 
-                        model_type, 
-                        layers, 
-                        units, 
-                        st.session_state.dense_layers, 
-                        st.session_state.dense_units, 
-                        st.session_state.learning_rate,
-                        st.session_state.use_attention,
-                        st.session_state.use_bidirectional,
-                        st.session_state.use_residual,
-                        st.session_state.dropout_rate
+                    # Split and scale data with the scaler fitted at training time
+                    train_size = int(len(processed_df) * train_split)
+                    _, X_train, y_train, X_test, y_test = split_and_scale(
+                        processed_df, feature_cols + [st.session_state.output_var], train_split, st.session_state.scaler,
+                        input_layout(feature_cols)
                     )
-                    st.session_state.model.load_weights(MODEL_WEIGHTS_PATH)
+                
+                # Use the live model if available, otherwise the exported SavedModel
+                inference_model = load_inference_model((X_train.shape[1], X_train.shape[2]), model_type)
                 
                 # Generate predictions with uncertainty (reduced samples for testing)
                 test_samples = min(20, st.session_state.num_samples)  # Reduce samples for testing
-                y_train_pred_mean, y_train_pred_std = predict_with_uncertainty(
-                    st.session_state.model,
+                y_train_pred_mean, y_train_pred_std, train_samples_drawn = predict_with_uncertainty(
+                    inference_model,
                     X_train,
-                    test_samples
+                    test_samples,
+                    jit_compile=st.session_state.use_xla,
+                    return_count=True
                 )
-                y_test_pred_mean, y_test_pred_std = predict_with_uncertainty(
-                    st.session_state.model,
+                y_test_pred_mean, y_test_pred_std, test_samples_drawn = predict_with_uncertainty(
+                    inference_model,
                     X_test,
-                    test_samples
+                    test_samples,
+                    jit_compile=st.session_state.use_xla,
+                    return_count=True
                 )
                 
-                # Inverse transform predictions
-                y_train_pred_mean = y_train_pred_mean.reshape(-1, 1)
-                y_test_pred_mean = y_test_pred_mean.reshape(-1, 1)
-                y_train = y_train.reshape(-1, 1)
-                y_test = y_test.reshape(-1, 1)
-                
-                # Ensure all arrays have matching first dimensions
-                min_train_len = min(len(y_train_pred_mean), len(X_train))
-                min_test_len = min(len(y_test_pred_mean), len(X_test))
-                
-                y_train_pred = scaler.inverse_transform(np.hstack([
-                    y_train_pred_mean[:min_train_len], 
-                    X_train[:min_train_len, 0, :]
-                ]))[:, 0]
-                
-                y_test_pred = scaler.inverse_transform(np.hstack([
-                    y_test_pred_mean[:min_test_len], 
-                    X_test[:min_test_len, 0, :]
-                ]))[:, 0]
-                
-                y_train_actual = scaler.inverse_transform(np.hstack([
-                    y_train[:min_train_len], 
-                    X_train[:min_train_len, 0, :]
-                ]))[:, 0]
-                
-                y_test_actual = scaler.inverse_transform(np.hstack([
-                    y_test[:min_test_len], 
-                    X_test[:min_test_len, 0, :]
-                ]))[:, 0]
+                # Inverse transform predictions with the stored target scalars
+                y_min, y_range = st.session_state.y_min, st.session_state.y_range
+                y_train_pred = inverse_scale_target(y_train_pred_mean, y_min, y_range)
+                y_test_pred = inverse_scale_target(y_test_pred_mean, y_min, y_range)
+                # Actual values come straight from the unscaled target column (same split as the inputs)
+                actual = processed_df[st.session_state.output_var].to_numpy(dtype=np.float32)
+                y_train_actual, y_test_actual = actual[:train_size], actual[train_size:]
+                y_train_pred_std = y_train_pred_std * y_range
+                y_test_pred_std = y_test_pred_std * y_range
                 
                 # Clip predictions to non-negative values
                 y_train_pred, y_test_pred = np.clip(y_train_pred, 0, None), np.clip(y_test_pred, 0, None)
                 
                 # Calculate metrics
-                metrics = {metric: {
-                    "Training": all_metrics_dict[metric](y_train_actual, y_train_pred),
-                    "Testing": all_metrics_dict[metric](y_test_actual, y_test_pred)
-                } for metric in st.session_state.selected_metrics}
+                train_metrics = compute_metrics(y_train_actual, y_train_pred, st.session_state.selected_metrics)
+                test_metrics = compute_metrics(y_test_actual, y_test_pred, st.session_state.selected_metrics)
+                metrics = {metric: {"Training": train_metrics[metric], "Testing": test_metrics[metric]}
+                           for metric in st.session_state.selected_metrics}
                 st.session_state.metrics = metrics
                 
                 # Create results DataFrames
-                dates = processed_df[st.session_state.date_col] if st.session_state.date_col else pd.RangeIndex(len(processed_df))
+                dates = processed_df[st.session_state.date_col].to_numpy() if st.session_state.date_col else np.arange(len(processed_df))
                 train_dates = dates[:train_size][:len(y_train_actual)]
                 test_dates = dates[train_size:][:len(y_test_actual)]
                 
@@ -1378,6 +2394,9 @@ with col2:
                     f"Predicted_{st.session_state.output_var}": y_test_pred[:min_test_len],
                     "Uncertainty": y_test_pred_std[:min_test_len]
                 })
+                # Serialize the downloads once per test run instead of on every rerun
+                st.session_state.train_csv = csv_bytes(st.session_state.train_results_df)
+                st.session_state.test_csv = csv_bytes(st.session_state.test_results_df)
                 
                 # Create prediction plot
                 fig = plot_prediction_with_uncertainty(
@@ -1388,113 +2407,93 @@ with col2:
                     f"Training: {st.session_state.output_var}"
                 )
                 st.session_state.fig = fig
+                st.session_state._want_plot_dl = False
+                st.session_state.plot_png = None
                 
-                st.success("Model tested successfully!")
+                st.success(f"Model tested successfully! Uncertainty from {train_samples_drawn} (train) / "
+                           f"{test_samples_drawn} (test) Monte Carlo samples.")
 
 # Cross-Validation Section
 if st.session_state.feature_cols:
     with st.expander("🔄 Cross-Validation", expanded=False):
         if st.button("Run Cross-Validation", key="cv_button"):
-            df = st.session_state.df.copy()
-            
-            # Preprocess data
-            processed_df, feature_cols = preprocess_data(
-                df, 
-                st.session_state.input_vars, 
-                st.session_state.output_var, 
-                st.session_state.var_types, 
-                st.session_state.num_lags,
-                st.session_state.date_col,
-                st.session_state.handle_missing,
-                st.session_state.remove_outliers,
-                st.session_state.outlier_threshold
-            )
+            configure_tensorflow(st.session_state.use_mixed_precision)
+            df = st.session_state.df
             
-            # Feature engineering
-            if st.session_state.enable_feature_engineering:
-                try:
-                    processed_df = engineer_features(
-                        processed_df,
-                        feature_cols,
-                        st.session_state.output_var,
-                        st.session_state.date_col
-                    )
-                except:
-                    # Silently continue with basic features
-                    pass
+            # Preprocess data, reusing the frame prepared at training time when nothing has changed
+            cached = st.session_state.cached_Xy
+            if cached is not None and cached[0] == preparation_key(df):
+                processed_df, feature_cols = cached[2:4]
+            else:
+                processed_df, feature_cols = prepare_features(
+                    df, 
+                    st.session_state.input_vars, 
+                    st.session_state.output_var, 
+                    st.session_state.var_types, 
+                    st.session_state.num_lags,
+                    st.session_state.date_col,
+                    st.session_state.handle_missing,
+                    st.session_state.remove_outliers,
+                    st.session_state.outlier_threshold,
+                    st.session_state.enable_feature_engineering
+                )
             
             # Scale data
-            scaler = MinMaxScaler()  # Create a new scaler for CV
-            scaled = scaler.fit_transform(processed_df[feature_cols + [st.session_state.output_var]])
-            X, y = scaled[:, :-1], scaled[:, -1]
-            X = X.reshape((X.shape[0], 1, X.shape[1]))
-            y = y.reshape(-1, 1)
+            cv_arr = processed_df[feature_cols + [st.session_state.output_var]].to_numpy(dtype=np.float32, copy=True)
+            scaler = FastMinMaxScaler.fit(cv_arr)  # Create a new scaler for CV
+            y_min, y_range = scaler.data_min[-1], scaler.data_range[-1]
+            X, y = scale_split(cv_arr, scaler)
+            X = to_sequences(X, input_layout(feature_cols))
             
             # Time series cross-validation
             tscv = TimeSeriesSplit(n_splits=5)
             cv_metrics = {metric: [] for metric in st.session_state.selected_metrics}
             
+            # Build the model once; each fold restarts from the same initial weights
+            layers = st.session_state[LAYERS_MAP[model_type]]
+            units = st.session_state[UNITS_MAP[model_type]]
+            
+            model = build_advanced_model(
+                (X.shape[1], X.shape[2]), 
+                model_type, 
+                layers, 
+                units, 
+                st.session_state.dense_layers, 
+                st.session_state.dense_units, 
+                st.session_state.learning_rate,
+                st.session_state.use_attention,
+                st.session_state.use_bidirectional,
+                st.session_state.use_residual,
+                st.session_state.dropout_rate,
+                st.session_state.use_xla
+            )
+            initial_weights = model.get_weights()
+            
             for train_idx, val_idx in tscv.split(X):
                 X_tr, X_val = X[train_idx], X[val_idx]
                 y_tr, y_val = y[train_idx], y[val_idx]
                 
-                # Build model
-                layers = (st.session_state.gru_layers if model_type in ["GRU", "Hybrid"] else 
-                          st.session_state.lstm_layers if model_type == "LSTM" else 
-                          st.session_state.rnn_layers if model_type == "RNN" else 
-                          st.session_state.gru_layers)
-                units = (st.session_state.gru_units if model_type in ["GRU", "Hybrid"] else 
-                         st.session_state.lstm_units if model_type == "LSTM" else 
-                         st.session_state.rnn_units if model_type == "RNN" else 
-                         st.session_state.gru_units)
-                
-                model = build_advanced_model(
-                    (X_tr.shape[1], X_tr.shape[2]), 
-                    model_type, 
-                    layers, 
-                    units, 
-                    st.session_state.dense_layers, 
-                    st.session_state.dense_units, 
-                    st.session_state.learning_rate,
-                    st.session_state.use_attention,
-                    st.session_state.use_bidirectional,
-                    st.session_state.use_residual,
-                    st.session_state.dropout_rate
-                )
+                # Fresh weights and optimizer state for this fold
+                reset_model_state(model, initial_weights, st.session_state.learning_rate)
                 
                 # Train model
-                model.fit(X_tr, y_tr, epochs=epochs, batch_size=batch_size, verbose=0)
+                model.fit(make_dataset(X_tr, y_tr, batch_size, shuffle=True), epochs=epochs, verbose=0)
                 
                 # Generate predictions
                 y_val_pred_mean, y_val_pred_std = predict_with_uncertainty(
                     model,
                     X_val,
-                    st.session_state.num_samples
+                    st.session_state.num_samples,
+                    jit_compile=st.session_state.use_xla
                 )
                 
-                # Reshape predictions and validation data
-                y_val_pred_mean = y_val_pred_mean.reshape(-1, 1)
-                X_val_features = X_val[:, 0, :]
-                
-                # Ensure arrays have matching first dimensions
-                min_len = min(len(y_val_pred_mean), len(X_val_features))
-                y_val_pred_mean = y_val_pred_mean[:min_len]
-                X_val_features = X_val_features[:min_len]
-                y_val = y_val[:min_len]
-                
-                # Stack arrays and inverse transform
-                stacked_pred = np.hstack([y_val_pred_mean, X_val_features])
-                stacked_actual = np.hstack([y_val, X_val_features])
-                
-                y_val_pred = scaler.inverse_transform(stacked_pred)[:, 0]
-                y_val_actual = scaler.inverse_transform(stacked_actual)[:, 0]
+                # Inverse transform with the fold scaler's target scalars
+                y_val_pred = inverse_scale_target(y_val_pred_mean, y_min, y_range)
+                y_val_actual = inverse_scale_target(y_val, y_min, y_range)
                 
                 # Calculate metrics
-                for metric in st.session_state.selected_metrics:
-                    cv_metrics[metric].append(all_metrics_dict[metric](y_val_actual, y_val_pred))
-                
-                # Clean up
-                tf.keras.backend.clear_session()
+                for metric, value in compute_metrics(y_val_actual, y_val_pred, st.session_state.selected_metrics).items():
+                    cv_metrics[metric].append(value)
             
             # Calculate mean metrics
             st.session_state.cv_metrics = {m: np.mean(cv_metrics[m]) for m in st.session_state.selected_metrics}
@@ -1518,28 +2517,36 @@ if any([st.session_state.metrics, st.session_state.fig, st.session_state.train_r
             st.markdown("**📈 Prediction Plot**")
             st.plotly_chart(st.session_state.fig, use_container_width=True)
             
-            # Download plot
-            buf = BytesIO()
-            try:
-                st.session_state.fig.write_image(buf, format="png")
-            except ValueError:
-                fig, ax = plt.subplots()
-                ax.plot(st.session_state.train_results_df["Date"], st.session_state.train_results_df[f"Actual_{st.session_state.output_var}"], label="Train Actual")
-                ax.plot(st.session_state.train_results_df["Date"], st.session_state.train_results_df[f"Predicted_{st.session_state.output_var}"], label="Train Predicted", linestyle="--")
-                ax.plot(st.session_state.test_results_df["Date"], st.session_state.test_results_df[f"Actual_{st.session_state.output_var}"], label="Test Actual")
-                ax.plot(st.session_state.test_results_df["Date"], st.session_state.test_results_df[f"Predicted_{st.session_state.output_var}"], label="Test Predicted", linestyle="--")
-                ax.legend()
-                ax.set_title(f"Training and Testing: {st.session_state.output_var}")
-                fig.savefig(buf, format="png", bbox_inches="tight")
-            st.download_button("⬇️ Download Plot", buf.getvalue(), "prediction_plot.png", "image/png", key="plot_dl")
+            # Download plot (rendered only once requested)
+            if not st.session_state.get("_want_plot_dl"):
+                st.button("🖼️ Prepare Plot Download", key="plot_dl_prepare",
+                          on_click=lambda: st.session_state.update(_want_plot_dl=True))
+            else:
+                # Render the PNG once per tested model and reuse the bytes on later reruns
+                if st.session_state.plot_png is None:
+                    buf = BytesIO()
+                    try:
+                        st.session_state.fig.write_image(buf, format="png")
+                    except ValueError:
+                        plt = lazy_import('matplotlib.pyplot')
+                        fig, ax = plt.subplots()
+                        ax.plot(st.session_state.train_results_df["Date"], st.session_state.train_results_df[f"Actual_{st.session_state.output_var}"], label="Train Actual")
+                        ax.plot(st.session_state.train_results_df["Date"], st.session_state.train_results_df[f"Predicted_{st.session_state.output_var}"], label="Train Predicted", linestyle="--")
+                        ax.plot(st.session_state.test_results_df["Date"], st.session_state.test_results_df[f"Actual_{st.session_state.output_var}"], label="Test Actual")
+                        ax.plot(st.session_state.test_results_df["Date"], st.session_state.test_results_df[f"Predicted_{st.session_state.output_var}"], label="Test Predicted", linestyle="--")
+                        ax.legend()
+                        ax.set_title(f"Training and Testing: {st.session_state.output_var}")
+                        fig.tight_layout()
+                        fig.savefig(buf, format="png", dpi=150, pil_kwargs=PNG_PIL_KWARGS)
+                        plt.close(fig)
+                    st.session_state.plot_png = buf.getvalue()
+                st.download_button("⬇️ Download Plot", st.session_state.plot_png, "prediction_plot.png", "image/png", key="plot_dl")
         
-        if st.session_state.train_results_df is not None:
-            train_csv = st.session_state.train_results_df.to_csv(index=False)
-            st.download_button("⬇️ Download Train Data CSV", train_csv, "train_predictions.csv", "text/csv", key="train_dl")
+        if st.session_state.train_csv is not None:
+            st.download_button("⬇️ Download Train Data CSV", st.session_state.train_csv, "train_predictions.csv", "text/csv", key="train_dl")
         
-        if st.session_state.test_results_df is not None:
-            test_csv = st.session_state.test_results_df.to_csv(index=False)
-            st.download_button("⬇️ Download Test Data CSV", test_csv, "test_predictions.csv", "text/csv", key="test_dl")
+        if st.session_state.test_csv is not None:
+            st.download_button("⬇️ Download Test Data CSV", st.session_state.test_csv, "test_predictions.csv", "text/csv", key="test_dl")
         
         # New Data Prediction Section
 if os.path.exists(MODEL_WEIGHTS_PATH):
@@ -1561,7 +2568,7 @@ if os.path.exists(MODEL_WEIGHTS_PATH):
             min_value=10,
             max_value=1000,
             value=st.session_state.num_samples,
-            help="Number of samples for uncertainty estimation"
+            help=f"Maximum samples for uncertainty estimation; sampling stops early (after at least {MC_MIN_SAMPLES}) once the means converge"
         )
         st.session_state.num_samples = num_samples
         
@@ -1574,20 +2581,20 @@ if os.path.exists(MODEL_WEIGHTS_PATH):
         )
         
         if new_data_files:
+            prediction_tasks = []
             for new_data_file in new_data_files:
-                # Load new data
-                if new_data_file.name.endswith('.csv'):
-                    new_df = pd.read_csv(new_data_file)
-                elif new_data_file.name.endswith('.json'):
-                    new_df = pd.read_json(new_data_file)
-                else:
-                    new_df = pd.read_excel(new_data_file)
+                # Load only the columns the model can use
+                new_df = read_new_data(
+                    new_data_file.getvalue(), new_data_file.name,
+                    tuple(st.session_state.input_vars) + (st.session_state.output_var,),
+                    st.session_state.date_col
+                )
                 
                 st.markdown(f"**Preview for {new_data_file.name}:**")
                 st.dataframe(new_df.head(), use_container_width=True)
                 
                 # Date column selection
-                datetime_cols = [col for col in new_df.columns if pd.api.types.is_datetime64_any_dtype(new_df[col]) or "date" in col.lower()]
+                datetime_cols = [col for col in new_df.columns if pd.api.types.is_datetime64_any_dtype(new_df[col]) or is_date_name(col)]
                 date_col = st.selectbox(
                     f"Select Date Column ({new_data_file.name})",
                     ["None"] + datetime_cols,
@@ -1597,13 +2604,13 @@ if os.path.exists(MODEL_WEIGHTS_PATH):
                 
                 if date_col != "None":
                     new_df[date_col] = pd.to_datetime(new_df[date_col])
-                    new_df = new_df.sort_values(date_col)
+                    if not new_df[date_col].is_monotonic_increasing:
+                        new_df = new_df.sort_values(date_col)
                 
                 # Input variable selection
                 input_vars = st.session_state.input_vars
                 output_var = st.session_state.output_var
                 num_lags = st.session_state.num_lags
-                feature_cols = st.session_state.feature_cols
                 
                 available_new_inputs = [col for col in new_df.columns if col in input_vars and col != date_col]
                 if not available_new_inputs:
@@ -1619,233 +2626,20 @@ if os.path.exists(MODEL_WEIGHTS_PATH):
                 
                 # Variable types
                 st.markdown(f"**Variable Types ({new_data_file.name})**")
-                new_var_types = {}
-                for var in selected_inputs:
-                    new_var_types[var] = st.selectbox(
-                        f"{var} Type",
-                        ["Dynamic", "Static"],
-                        key=f"new_{var}_type_{new_data_file.name}"
-                    )
+                new_var_types = var_types_editor(selected_inputs, st.session_state.var_types, f"new_var_types_{new_data_file.name}")
+                
+                if len(new_df) < (num_lags + 1 if any(new_var_types[var] == "Dynamic" for var in selected_inputs) else 1):
+                    st.error(f"{new_data_file.name} has insufficient rows for {num_lags} lags.")
+                    continue
                 
+                task = SimpleNamespace(file_name=new_data_file.name, new_df=new_df, date_col=date_col,
+                                       selected_inputs=selected_inputs, var_types=new_var_types)
+                prediction_tasks.append(task)
                 if st.button(f"🔍 Predict ({new_data_file.name})", key=f"predict_button_{new_data_file.name}"):
-                    if len(new_df) < (num_lags + 1 if any(new_var_types[var] == "Dynamic" for var in selected_inputs) else 1):
-                        st.error(f"{new_data_file.name} has insufficient rows for {num_lags} lags.")
-                        continue
-                    
-                    # Preprocess new data
-                    feature_cols_new = []
-                    for var in selected_inputs:
-                        if new_var_types[var] == "Dynamic":
-                            for lag in range(1, num_lags + 1):
-                                new_df[f'{var}_Lag_{lag}'] = new_df[var].shift(lag)
-                                feature_cols_new.append(f'{var}_Lag_{lag}')
-                        else:
-                            feature_cols_new.append(var)
-                    
-                    # Add output variable lags
-                    for lag in range(1, num_lags + 1):
-                        new_df[f'{output_var}_Lag_{lag}'] = new_df[output_var].shift(lag) if output_var in new_df.columns else 0
-                        feature_cols_new.append(f'{output_var}_Lag_{lag}')
-                    
-                    # Handle missing values
-                    new_df.dropna(subset=[col for col in feature_cols_new if "_Lag_" in col], how='all', inplace=True)
-                    
-                    # Create full feature set
-                    full_new_df = pd.DataFrame(index=new_df.index, columns=feature_cols + [output_var])
-                    full_new_df[output_var] = new_df[output_var] if output_var in new_df.columns else 0
-                    
-                    for col in feature_cols_new:
-                        if col in full_new_df.columns and col in new_df.columns:
-                            full_new_df[col] = new_df[col]
-                    
-                    # Fill remaining NaN values
-                    full_new_df.fillna(0, inplace=True)
-                    full_new_df = full_new_df[feature_cols + [output_var]].apply(pd.to_numeric, errors='coerce')
-                    
-                    # Scale data
-                    scaler = st.session_state.scaler
-                    new_scaled = scaler.transform(full_new_df[feature_cols + [output_var]])
-                    X_new = new_scaled[:, :-1]
-                    X_new = X_new.reshape((X_new.shape[0], 1, X_new.shape[1]))
-                    
-                    # Build and load model
-                    layers = (st.session_state.gru_layers if model_type in ["GRU", "Hybrid"] else 
-                              st.session_state.lstm_layers if model_type == "LSTM" else 
-                              st.session_state.rnn_layers if model_type == "RNN" else 
-                              st.session_state.gru_layers)
-                    units = (st.session_state.gru_units if model_type in ["GRU", "Hybrid"] else 
-                             st.session_state.lstm_units if model_type == "LSTM" else 
-                             st.session_state.rnn_units if model_type == "RNN" else 
-                             st.session_state.gru_units)
-                    
-                    if st.session_state.model is None:
-                        st.session_state.model = build_advanced_model(
-                            (X_new.shape[1], X_new.shape[2]), 
-                            model_type, 
-                            layers, 
-                            units, 
-                            st.session_state.dense_layers, 
-                            st.session_state.dense_units, 
-                            st.session_state.learning_rate,
-                            st.session_state.use_attention,
-                            st.session_state.use_bidirectional,
-                            st.session_state.use_residual,
-                            st.session_state.dropout_rate
-                        )
-                        st.session_state.model.load_weights(MODEL_WEIGHTS_PATH)
-                    
-                    # Generate predictions with uncertainty
-                    y_new_pred_mean, y_new_pred_std = predict_with_uncertainty(
-                        st.session_state.model,
-                        X_new,
-                        st.session_state.num_samples
-                    )
-                    
-                    # Reshape predictions to match dimensions
-                    y_new_pred_mean = y_new_pred_mean.reshape(-1, 1)  # Reshape to 2D array
-                    X_new_2d = X_new[:, 0, :].reshape(y_new_pred_mean.shape[0], -1)  # Ensure matching dimensions
-                    
-                    # Ensure arrays have matching first dimensions
-                    min_len = min(len(y_new_pred_mean), len(X_new_2d))
-                    y_new_pred_mean = y_new_pred_mean[:min_len]
-                    X_new_2d = X_new_2d[:min_len]
-                    
-                    # Inverse transform predictions
-                    y_new_pred = scaler.inverse_transform(np.hstack([y_new_pred_mean, X_new_2d]))[:, 0]
-                    y_new_pred = np.clip(y_new_pred, 0, None)
-                    
-                    # Create results DataFrame
-                    dates = new_df[date_col] if date_col != "None" else pd.RangeIndex(len(new_df))
-                    
-                    # Create predictions DataFrame with proper date handling
-                    predictions_df = pd.DataFrame({
-                        "Date": dates,
-                        "Actual_Discharge": new_df[output_var] if output_var in new_df.columns else None,
-                        "Predicted_Discharge": y_new_pred,
-                        "Uncertainty": y_new_pred_std[:min_len]
-                    })
-                    
-                    # Create enhanced plot
-                    fig = go.Figure()
-                    
-                    # Plot actual discharge if available
-                    if output_var in new_df.columns:
-                        fig.add_trace(go.Scatter(
-                            x=dates,
-                            y=new_df[output_var],
-                            name="Actual Discharge",
-                            line=dict(color='blue', width=2),
-                            hovertemplate='<b>Date</b>: %{x}<br><b>Actual Discharge</b>: %{y:.2f} m³/s<br>'
-                        ))
-                    
-                    # Plot predicted discharge
-                    fig.add_trace(go.Scatter(
-                        x=dates[-len(y_new_pred):],
-                        y=y_new_pred,
-                        name="Predicted Discharge",
-                        line=dict(color='red', width=2),
-                        hovertemplate='<b>Date</b>: %{x}<br><b>Predicted Discharge</b>: %{y:.2f} m³/s<br>'
-                    ))
-                    
-                    # Add confidence interval
-                    fig.add_trace(go.Scatter(
-                        x=dates[-len(y_new_pred):].tolist() + dates[-len(y_new_pred):][::-1].tolist(),
-                        y=(y_new_pred + 1.96 * y_new_pred_std[:min_len]).tolist() + 
-                          (y_new_pred - 1.96 * y_new_pred_std[:min_len])[::-1].tolist(),
-                        fill='toself',
-                        fillcolor='rgba(255,0,0,0.2)',
-                        line=dict(color='rgba(255,0,0,0)'),
-                        name='95% Confidence Interval',
-                        showlegend=True
-                    ))
-                    
-                    # Update layout
-                    fig.update_layout(
-                        title=dict(
-                            text=f"Discharge Analysis - {new_data_file.name}",
-                            font=dict(size=24)
-                        ),
-                        xaxis=dict(
-                            title="Date",
-                            showgrid=True,
-                            gridcolor='rgba(211, 211, 211, 0.4)',
-                            showline=True
-                        ),
-                        yaxis=dict(
-                            title="Discharge (m³/s)",
-                            showgrid=True,
-                            gridcolor='rgba(211, 211, 211, 0.4)',
-                            showline=True,
-                            rangemode='nonnegative'
-                        ),
-                        plot_bgcolor='white',
-                        height=700,
-                        hovermode='x unified'
-                    )
-                    
-                    # Display the plot
-                    st.plotly_chart(fig, use_container_width=True)
-                    
-                    # Create download buttons
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        # Plot download
-                        try:
-                            img_bytes = BytesIO()
-                            fig.write_image(img_bytes, format='png', width=1920, height=1080, scale=2)
-                            img_bytes.seek(0)
-                            
-                            st.download_button(
-                                "⬇️ Download Plot (PNG)",
-                                img_bytes.getvalue(),
-                                f"discharge_analysis_{new_data_file.name}.png",
-                                mime="image/png"
-                            )
-                        except Exception as e:
-                            # Silently switch to alternative method without showing warning
-                            plt.figure(figsize=(16, 9), dpi=300)
-                            if output_var in new_df.columns:
-                                plt.plot(dates, new_df[output_var], 'b-', linewidth=2, label='Actual')
-                            plt.plot(dates[-len(y_new_pred):], y_new_pred, 'r-', linewidth=2, label='Predicted')
-                            plt.fill_between(dates[-len(y_new_pred):],
-                                           y_new_pred - 1.96 * y_new_pred_std[:min_len],
-                                           y_new_pred + 1.96 * y_new_pred_std[:min_len],
-                                           color='red', alpha=0.2, label='95% CI')
-                            plt.title(f"Discharge Analysis - {new_data_file.name}")
-                            plt.xlabel("Date")
-                            plt.ylabel("Discharge (m³/s)")
-                            plt.grid(True, alpha=0.3)
-                            plt.legend()
-                            plt.xticks(rotation=45)
-                            
-                            img_bytes = BytesIO()
-                            plt.savefig(img_bytes, format='png', dpi=300, bbox_inches='tight')
-                            img_bytes.seek(0)
-                            plt.close()
-                            
-                            st.download_button(
-                                "⬇️ Download Plot (PNG)",
-                                img_bytes.getvalue(),
-                                f"discharge_analysis_{new_data_file.name}.png",
-                                mime="image/png"
-                            )
-                    
-                    with col2:
-                        # Data download
-                        csv = predictions_df.to_csv(index=False)
-                        st.download_button(
-                            "⬇️ Download Predictions (CSV)",
-                            csv,
-                            f"discharge_predictions_{new_data_file.name}.csv",
-                            "text/csv"
-                        )
-                    
-                    # Display predictions table
-                    st.markdown("### Prediction Results")
-                    st.dataframe(predictions_df, use_container_width=True)
-                    
-                    st.success(f"Analysis completed successfully for {new_data_file.name}!")
+                    run_new_predictions([task], model_type)
+            
+            if len(prediction_tasks) > 1 and st.button("🔍 Predict All Files", key="predict_all_button"):
+                run_new_predictions(prediction_tasks, model_type)
 # Bottom ad container at the end
 st.components.v1.html("""
     <div class="ad-container">